@@ -0,0 +1,24 @@
+"""Rebuild the daily_rollups collection from habit_logs and mood_logs.
+
+Usage (from the backend directory):
+    python backfill_rollups.py [--user-id USER_ID]
+"""
+import argparse
+import asyncio
+
+from server import client, date_storage, db, ensure_indexes, rebuild_daily_rollups, logger
+
+
+async def main(user_id=None):
+    await ensure_indexes()
+    await date_storage.load(db)
+    written = await rebuild_daily_rollups(user_id)
+    logger.info(f"Rebuilt {written} daily rollup entries")
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--user-id", help="Only rebuild rollups for this user")
+    args = parser.parse_args()
+    asyncio.run(main(args.user_id))
@@ -0,0 +1,378 @@
+"""Load test every API route and compare the results against a baseline.
+
+Starts the API, seeds synthetic users through the API itself, then drives
+each route in turn with --concurrency parallel clients and reports p50/p95/
+p99 latency, requests per second and MongoDB operations per request.
+
+Against a local mongod (the server runs under uvicorn in a subprocess and
+uses a throwaway database that is dropped afterwards), from backend/:
+    python benchmarks/load_test.py --mongo-url mongodb://localhost:27017
+
+Fully in-process, with mongomock-motor standing in for MongoDB (needs
+`pip install mongomock-motor`; the app and the load generator then share
+one event loop, so absolute numbers are only comparable between runs of
+the same mode; mongomock lacks some operators the app uses, such as
+$setDifference, so routes that need them report errors):
+    python benchmarks/load_test.py --in-process
+
+Save a run and compare later runs against it:
+    python benchmarks/load_test.py --output baseline.json
+    python benchmarks/load_test.py --output run.json --baseline baseline.json
+
+Mongo ops are the server's opcounters delta with a real mongod, or the
+number of collection calls with mongomock. With --baseline the exit status
+is 1 when any route's p95 grows, or its req/s drops, by more than
+--threshold.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Callable, Optional
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SEED_BATCH_SIZE = 2000
+BATCH_ENTRIES = 100  # per request in the batch and import routes
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+@dataclass
+class Route:
+    name: str
+    build: Callable  # (session, i) -> kwargs for httpx.AsyncClient.request
+    on_response: Optional[Callable] = None  # (session, response)
+    per_user: bool = False  # one request per user instead of --requests
+
+
+def auth(session):
+    return {"Authorization": f"Bearer {session['token']}"}
+
+
+def past_day(i, days):
+    return (date.today() - timedelta(days=i % days)).isoformat()
+
+
+def make_routes(run_id, days):
+    def get(path, **params):
+        return lambda session, i: {"method": "GET", "url": path, "params": params, "headers": auth(session)}
+
+    def habit(session, i):
+        return session["habit_ids"][i % len(session["habit_ids"])]
+
+    def habit_logs(session, i):
+        return [{"habit_id": habit(session, i + j), "date": past_day(i + j, days), "completed": (i + j) % 3 != 0}
+                for j in range(BATCH_ENTRIES)]
+
+    def mood_logs(session, i):
+        return [{"date": past_day(i + j, days), "mood_level": (i + j) % 5 + 1, "emoji": "🙂"} for j in range(BATCH_ENTRIES)]
+
+    def ndjson(entries):
+        return "\n".join(json.dumps(entry) for entry in entries)
+
+    def keep(key, field):
+        def collect(session, response):
+            value = response.json().get(field)
+            if value is not None:
+                session[key].append(value)
+        return collect
+
+    def pop(key):
+        return lambda session: session[key].pop() if session[key] else "missing"
+
+    spare_token = pop("spare_tokens")
+    created_habit = pop("created_habits")
+    seeded_mood = pop("mood_dates")
+
+    return [
+        Route("POST /auth/register", lambda s, i: {"method": "POST", "url": "/api/auth/register", "json": {
+            "email": f"bench-{run_id}-{i}@example.com", "password": "bench-password"}}),
+        Route("POST /auth/login", lambda s, i: {"method": "POST", "url": "/api/auth/login", "json": {
+            "email": s["email"], "password": s["password"]}}, keep("spare_tokens", "token")),
+        Route("GET /habits", get("/api/habits")),
+        Route("GET /habits/heatmaps", get("/api/habits/heatmaps")),
+        Route("GET /habits/{id}/heatmap", lambda s, i: get(f"/api/habits/{habit(s, i)}/heatmap")(s, i)),
+        Route("GET /habit-logs", get("/api/habit-logs")),
+        Route("GET /habit-logs?from", lambda s, i: get("/api/habit-logs", **{"from": past_day(30, days + 1)})(s, i)),
+        Route("GET /mood-logs", get("/api/mood-logs")),
+        Route("GET /sync", get("/api/sync")),
+        Route("GET /sync?since", lambda s, i: get("/api/sync", since=s["sync_token"])(s, i)),
+        Route("GET /export", lambda s, i: {**get("/api/export")(s, i), "headers": {**auth(s), "Accept-Encoding": "gzip"}}),
+        Route("GET /dashboard", get("/api/dashboard")),
+        Route("GET /analytics/summary", get("/api/analytics/summary")),
+        Route("GET /analytics/correlations", get("/api/analytics/correlations")),
+        # Jobs first: once an answer is cached no new job is queued
+        Route("POST /analytics/ai-insights/jobs", lambda s, i: {
+            "method": "POST", "url": "/api/analytics/ai-insights/jobs", "headers": auth(s)}, keep("job_ids", "job_id")),
+        Route("GET /analytics/ai-insights/jobs/{id}", lambda s, i: get(
+            f"/api/analytics/ai-insights/jobs/{s['job_ids'][i % len(s['job_ids'])] if s['job_ids'] else 'missing'}")(s, i)),
+        Route("GET /analytics/ai-insights", get("/api/analytics/ai-insights")),
+        Route("GET /analytics/ai-insights/stream", get("/api/analytics/ai-insights/stream")),
+        Route("GET /settings", get("/api/settings")),
+        Route("PUT /settings", lambda s, i: {"method": "PUT", "url": "/api/settings", "headers": auth(s),
+                                             "json": {"theme": "dark" if i % 2 else "light"}}),
+        Route("POST /habits", lambda s, i: {"method": "POST", "url": "/api/habits", "headers": auth(s),
+                                            "json": {"name": f"Bench {i}", "color": "#a8b5a1"}}, keep("created_habits", "id")),
+        Route("PUT /habits/{id}", lambda s, i: {"method": "PUT", "url": f"/api/habits/{habit(s, i)}", "headers": auth(s),
+                                                "json": {"name": f"Habit {i}", "color": "#74c69d"}}),
+        Route("POST /habit-logs", lambda s, i: {"method": "POST", "url": "/api/habit-logs", "headers": auth(s), "json": {
+            "habit_id": habit(s, i), "date": past_day(i, days), "completed": i % 2 == 0}}),
+        Route("POST /habit-logs/batch", lambda s, i: {"method": "POST", "url": "/api/habit-logs/batch",
+                                                      "headers": auth(s), "json": {"logs": habit_logs(s, i)}}),
+        Route("POST /habit-logs/import", lambda s, i: {"method": "POST", "url": "/api/habit-logs/import",
+                                                       "headers": auth(s), "content": ndjson(habit_logs(s, i))}),
+        Route("POST /mood-logs", lambda s, i: {"method": "POST", "url": "/api/mood-logs", "headers": auth(s), "json": {
+            "date": past_day(i, days), "mood_level": i % 5 + 1, "emoji": "🙂"}}),
+        Route("POST /mood-logs/batch", lambda s, i: {"method": "POST", "url": "/api/mood-logs/batch",
+                                                     "headers": auth(s), "json": {"logs": mood_logs(s, i)}}),
+        Route("POST /mood-logs/import", lambda s, i: {"method": "POST", "url": "/api/mood-logs/import",
+                                                      "headers": auth(s), "content": ndjson(mood_logs(s, i))}),
+        Route("DELETE /mood-logs/{date}", lambda s, i: {"method": "DELETE", "url": f"/api/mood-logs/{seeded_mood(s)}",
+                                                        "headers": auth(s)}),
+        Route("DELETE /habits/{id}", lambda s, i: {"method": "DELETE", "url": f"/api/habits/{created_habit(s)}",
+                                                   "headers": auth(s)}),
+        Route("POST /auth/logout", lambda s, i: {"method": "POST", "url": "/api/auth/logout",
+                                                 "headers": {"Authorization": f"Bearer {spare_token(s)}"}}),
+        # Revokes every token the user holds, so it runs last and once per user
+        Route("POST /auth/logout-all", lambda s, i: {"method": "POST", "url": "/api/auth/logout-all",
+                                                     "headers": auth(s)}, per_user=True),
+    ]
+
+
+async def seed(client, run_id, users, habits, days, rng):
+    sessions = []
+    for u in range(users):
+        email, password = f"seed-{run_id}-{u}@example.com", "bench-password"
+        response = await client.post("/api/auth/register", json={"email": email, "password": password})
+        response.raise_for_status()
+        session = {"email": email, "password": password, "token": response.json()["token"], "habit_ids": [],
+                   "spare_tokens": [], "created_habits": [], "job_ids": [], "mood_dates": []}
+        for h in range(habits):
+            response = await client.post("/api/habits", headers=auth(session),
+                                         json={"name": f"Habit {h}", "color": "#a8b5a1"})
+            response.raise_for_status()
+            session["habit_ids"].append(response.json()["id"])
+
+        logs = [{"habit_id": habit_id, "date": past_day(d, days), "completed": rng.random() < 0.6}
+                for d in range(days) for habit_id in session["habit_ids"]]
+        moods = [{"date": past_day(d, days), "mood_level": rng.randint(1, 5), "emoji": "🙂"}
+                 for d in range(days) if rng.random() < 0.8]
+        session["mood_dates"] = [mood["date"] for mood in moods]
+        for path, entries in (("/api/habit-logs/batch", logs), ("/api/mood-logs/batch", moods)):
+            for start in range(0, len(entries), SEED_BATCH_SIZE):
+                response = await client.post(path, headers=auth(session),
+                                             json={"logs": entries[start:start + SEED_BATCH_SIZE]})
+                response.raise_for_status()
+
+        response = await client.get("/api/sync", headers=auth(session))
+        response.raise_for_status()
+        session["sync_token"] = response.json()["token"]
+        sessions.append(session)
+    return sessions
+
+
+async def run_route(client, route, sessions, count, concurrency, count_ops):
+    latencies = []
+    errors = 0
+    indexes = iter(range(count))
+
+    async def worker():
+        nonlocal errors
+        for i in indexes:
+            session = sessions[i % len(sessions)]
+            request = route.build(session, i)
+            start = time.perf_counter()
+            try:
+                response = await client.request(**request)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                response, failed = None, True
+            latencies.append((time.perf_counter() - start) * 1000)
+            if failed:
+                errors += 1
+            elif route.on_response:
+                route.on_response(session, response)
+
+    ops_before = count_ops()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    ops = count_ops() - ops_before
+    return {
+        "requests": count,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.mean(latencies), 2),
+        "rps": round(count / elapsed, 1),
+        "mongo_ops_per_request": round(ops / count, 2)
+    }
+
+
+async def run_benchmark(client, args, count_ops):
+    rng = random.Random(args.seed)
+    run_id = uuid.uuid4().hex[:8]
+    started = time.perf_counter()
+    sessions = await seed(client, run_id, args.users, args.habits, args.days, rng)
+    seed_seconds = time.perf_counter() - started
+
+    results = {}
+    print(f"{'route':<40} {'n':>5} {'err':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'req/s':>8} {'ops/req':>8}")
+    for route in make_routes(run_id, args.days):
+        if args.routes and not any(pattern in route.name for pattern in args.routes):
+            continue
+        count = len(sessions) if route.per_user else args.requests
+        stats = await run_route(client, route, sessions, count, min(args.concurrency, count), count_ops)
+        results[route.name] = stats
+        print(f"{route.name:<40} {count:>5} {stats['errors']:>4} {stats['p50_ms']:>6.1f}ms {stats['p95_ms']:>6.1f}ms "
+              f"{stats['p99_ms']:>6.1f}ms {stats['rps']:>8.1f} {stats['mongo_ops_per_request']:>8.2f}")
+    return seed_seconds, results
+
+
+async def run_in_process(args):
+    for name, value in {"MONGO_URL": "mongodb://localhost:27017", "DB_NAME": "bench", "JWT_SECRET": "bench",
+                        "LLM_CLIENT": "stub"}.items():
+        os.environ.setdefault(name, value)
+    try:
+        import mongomock_motor
+    except ImportError:
+        sys.exit("--in-process needs mongomock-motor: pip install mongomock-motor")
+    import motor.motor_asyncio
+    motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+
+    # Count every collection call the app makes
+    ops = [0]
+    collection = mongomock_motor.AsyncMongoMockCollection
+    for name in ("find", "aggregate", "bulk_write", "count_documents", "delete_many", "delete_one", "distinct",
+                 "estimated_document_count", "find_one", "find_one_and_delete", "find_one_and_update",
+                 "insert_many", "insert_one", "replace_one", "update_many", "update_one"):
+        def counted(self, *a, _method=getattr(collection, name), **kw):
+            ops[0] += 1
+            return _method(self, *a, **kw)
+        setattr(collection, name, counted)
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server
+    await server.startup_db_client()
+    try:
+        transport = httpx.ASGITransport(app=server.app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+            return await run_benchmark(client, args, lambda: ops[0])
+    finally:
+        await server.shutdown_db_client()
+
+
+async def run_against_mongod(args):
+    from pymongo import MongoClient
+
+    db_name = f"habitmap_bench_{uuid.uuid4().hex[:8]}"
+    env = {**os.environ, "MONGO_URL": args.mongo_url, "DB_NAME": db_name, "LLM_CLIENT": "stub"}
+    env.setdefault("JWT_SECRET", "bench")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(args.port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    mongo = MongoClient(args.mongo_url)
+
+    def count_ops():
+        counters = mongo.admin.command("serverStatus")["opcounters"]
+        # Minus the serverStatus command itself
+        return sum(counters[name] for name in ("insert", "query", "update", "delete", "getmore", "command")) - 1
+
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=args.timeout) as client:
+            for _ in range(100):
+                if server.poll() is not None:
+                    sys.exit("Server exited during startup")
+                try:
+                    if (await client.get("/api/health/ready")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            return await run_benchmark(client, args, count_ops)
+    finally:
+        server.terminate()
+        server.wait()
+        mongo.drop_database(db_name)
+        mongo.close()
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f"\n{'route':<40} {'p95 base':>9} {'p95 now':>9} {'rps base':>9} {'rps now':>9}")
+    for name, stats in results.items():
+        base = baseline["routes"].get(name)
+        if not base:
+            continue
+        slower = stats["p95_ms"] > base["p95_ms"] * (1 + threshold)
+        fewer = stats["rps"] < base["rps"] / (1 + threshold)
+        flag = "  REGRESSION" if slower or fewer else ""
+        print(f"{name:<40} {base['p95_ms']:>7.1f}ms {stats['p95_ms']:>7.1f}ms {base['rps']:>9.1f} {stats['rps']:>9.1f}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--mongo-url", default="mongodb://localhost:27017", help="mongod to run the server against")
+    mode.add_argument("--in-process", action="store_true", help="Run the app in-process on mongomock-motor")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--habits", type=int, default=5, help="Habits per user")
+    parser.add_argument("--days", type=int, default=365, help="Days of history per user")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per route")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--routes", nargs="+", help="Only run routes whose name contains one of these")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the synthetic history")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results from an earlier --output")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative p95/req/s regression")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    started_at = datetime.now(timezone.utc).isoformat()
+
+    runner = run_in_process if args.in_process else run_against_mongod
+    seed_seconds, results = asyncio.run(runner(args))
+    report = {
+        "meta": {
+            "started_at": started_at,
+            "mode": "in-process" if args.in_process else "mongod",
+            "python": platform.python_version(),
+            **{key: getattr(args, key) for key in ("users", "habits", "days", "requests", "concurrency", "seed")}
+        },
+        "seed_seconds": round(seed_seconds, 2),
+        "routes": results
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} route(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
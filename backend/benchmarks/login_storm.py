@@ -0,0 +1,90 @@
+"""Measure /api/habits latency while the server is hit by a burst of logins.
+
+Start the API first (e.g. `uvicorn server:app --port 8001` from backend/),
+then run:
+    python benchmarks/login_storm.py --base-url http://localhost:8001
+
+A quiet baseline of /api/habits requests is measured first, then the same
+probe runs while --logins concurrent login requests are in flight. With
+bcrypt on the event loop the storm p99 grows with the number of logins;
+with the hashing pool it should stay close to the baseline.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+
+import httpx
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(label, samples):
+    print(f"{label:>10}: n={len(samples):4d}  p50={percentile(samples, 50):7.1f} ms  "
+          f"p95={percentile(samples, 95):7.1f} ms  p99={percentile(samples, 99):7.1f} ms  "
+          f"mean={statistics.mean(samples):7.1f} ms")
+
+
+async def probe(client, headers, stop, samples, interval):
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get("/api/habits", headers=headers)
+        response.raise_for_status()
+        samples.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+
+
+async def storm(client, credentials, logins, concurrency):
+    statuses = {}
+    slots = asyncio.Semaphore(concurrency)
+
+    async def login():
+        async with slots:
+            response = await client.post("/api/auth/login", json=credentials)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    await asyncio.gather(*(login() for _ in range(logins)))
+    return statuses
+
+
+async def main(args):
+    credentials = {"email": f"bench_{uuid.uuid4().hex[:8]}@example.com", "password": "BenchPass123!"}
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as client:
+        response = await client.post("/api/auth/register", json=credentials)
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+        baseline = []
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, headers, stop, baseline, args.interval))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        await task
+
+        during = []
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, headers, stop, during, args.interval))
+        started = time.perf_counter()
+        statuses = await storm(client, credentials, args.logins, args.concurrency)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await task
+
+    summarize("baseline", baseline)
+    summarize("storm", during)
+    print(f"{args.logins} logins in {elapsed:.2f}s, status codes: {statuses}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--logins", type=int, default=200, help="Total login requests in the storm")
+    parser.add_argument("--concurrency", type=int, default=50, help="Logins in flight at once")
+    parser.add_argument("--interval", type=float, default=0.01, help="Pause between /api/habits probes (s)")
+    parser.add_argument("--baseline-seconds", type=float, default=3)
+    asyncio.run(main(parser.parse_args()))
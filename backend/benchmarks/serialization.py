@@ -0,0 +1,89 @@
+"""Compare the default and fast serialization paths for list responses.
+
+Runs in-process (no server or MongoDB needed), from the backend directory:
+    python benchmarks/serialization.py [--sizes 1000 10000 100000]
+
+Two throwaway routes return the same synthetic HabitLog documents: one the
+default way (response_model validation + jsonable_encoder + json), one via
+list_response with FAST_LIST_RESPONSES enabled (orjson, no re-validation).
+Each is timed end to end through the ASGI app.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+for name, value in {"MONGO_URL": "mongodb://localhost:27017", "DB_NAME": "bench", "JWT_SECRET": "bench", "LLM_CLIENT": "stub"}.items():
+    os.environ.setdefault(name, value)
+
+import httpx
+from fastapi import FastAPI, Response
+
+import server
+from server import HabitLog
+
+
+def make_logs(count):
+    user_id = str(uuid.uuid4())
+    habit_ids = [str(uuid.uuid4()) for _ in range(8)]
+    return [
+        HabitLog(
+            user_id=user_id,
+            habit_id=habit_ids[i % len(habit_ids)],
+            date=f"{2000 + i // 366:04d}-{(i // 28) % 12 + 1:02d}-{i % 28 + 1:02d}",
+            completed=i % 3 != 0
+        ).model_dump()
+        for i in range(count)
+    ]
+
+
+def build_app(logs):
+    app = FastAPI()
+
+    @app.get("/default", response_model=List[HabitLog])
+    async def default_path():
+        return logs
+
+    @app.get("/fast", response_model=List[HabitLog])
+    async def fast_path(response: Response):
+        return server.list_response(logs, response)
+
+    return app
+
+
+async def time_route(client, path, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = await client.get(path)
+        response.raise_for_status()
+        timings.append(time.perf_counter() - start)
+    return min(timings), len(response.content)
+
+
+async def main(sizes, repeat):
+    server.FAST_LIST_RESPONSES = True
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    print(f"{'rows':>8}  {'default':>10}  {'fast':>10}  {'speedup':>8}  {'bytes':>10}")
+    for size in sizes:
+        app = build_app(make_logs(size))
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            default_time, default_bytes = await time_route(client, "/default", repeat)
+            fast_time, fast_bytes = await time_route(client, "/fast", repeat)
+        print(f"{size:>8}  {default_time * 1000:>8.1f}ms  {fast_time * 1000:>8.1f}ms  "
+              f"{default_time / fast_time:>7.1f}x  {fast_bytes:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per size; the fastest is reported")
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.repeat))
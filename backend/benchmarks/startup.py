@@ -0,0 +1,112 @@
+"""Measure how long a fresh API process takes to start taking traffic.
+
+From the backend directory:
+    python benchmarks/startup.py [--runs 5] [--mongo-url mongodb://localhost:27017]
+
+Each run starts a new interpreter, so nothing is cached between runs. Two
+numbers are reported per run:
+- import: time to `import server` (no MongoDB needed)
+- live / ready: time from launching uvicorn until /api/health/live and
+  /api/health/ready first answer 200 (needs a reachable mongod; skipped
+  with --import-only)
+
+--importtime lists the slowest modules of one import, from `python -X
+importtime`.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import server; print(time.perf_counter() - t)"
+
+
+def server_env(mongo_url):
+    env = {**os.environ, "MONGO_URL": mongo_url}
+    for name, value in {"DB_NAME": "habitmap_startup_bench", "JWT_SECRET": "bench", "EMERGENT_LLM_KEY": "bench"}.items():
+        env.setdefault(name, value)
+    return env
+
+
+def time_import(env):
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def slowest_imports(env, count):
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import server"], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def time_until_ready(env, port, timeout):
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    live = ready = None
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1) as client:
+            while ready is None and time.perf_counter() - started < timeout:
+                if server.poll() is not None:
+                    sys.exit("Server exited during startup")
+                try:
+                    if live is None and client.get("/api/health/live").status_code == 200:
+                        live = time.perf_counter() - started
+                    if live is not None and client.get("/api/health/ready").status_code == 200:
+                        ready = time.perf_counter() - started
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+    finally:
+        server.terminate()
+        server.wait()
+    if ready is None:
+        sys.exit(f"Server was not ready after {timeout}s")
+    return live, ready
+
+
+def summarize(label, samples):
+    print(f"{label:>7}: min={min(samples) * 1000:7.0f} ms  median={statistics.median(samples) * 1000:7.0f} ms  "
+          f"max={max(samples) * 1000:7.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--import-only", action="store_true", help="Skip the uvicorn runs (no mongod needed)")
+    parser.add_argument("--importtime", type=int, metavar="N", help="Also list the N slowest imports")
+    args = parser.parse_args()
+    env = server_env(args.mongo_url)
+
+    summarize("import", [time_import(env) for _ in range(args.runs)])
+    if not args.import_only:
+        runs = [time_until_ready(env, args.port, args.timeout) for _ in range(args.runs)]
+        summarize("live", [live for live, _ in runs])
+        summarize("ready", [ready for _, ready in runs])
+
+    if args.importtime:
+        print("\nslowest imports (cumulative):")
+        for microseconds, name in slowest_imports(env, args.importtime):
+            print(f"{microseconds / 1000:9.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
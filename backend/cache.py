@@ -0,0 +1,160 @@
+"""Small async key/value caches with TTL expiry and LRU eviction.
+
+Both backends share the same interface: `get` returns a CacheEntry or None,
+`set` stores a value, `delete` drops a key. MemoryCache lives in the worker
+process; MongoCache stores entries in a collection so they survive restarts
+and are shared between workers.
+
+ReadThroughCache wraps either backend: it loads missing values on demand,
+counts hits and misses, and lets writers invalidate a key. Values can be
+tagged with a version; an entry stored under another version is a miss.
+"""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Optional
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    stored_at: float
+    expires_at: float = float("inf")
+
+    @property
+    def age_seconds(self) -> float:
+        return max(0.0, time.time() - self.stored_at)
+
+
+class MemoryCache:
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() >= entry.expires_at:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        now = time.time()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = CacheEntry(value, now, now + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    async def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MongoCache:
+    # Expiry is enforced on read and by a TTL index on `expires_at`; the
+    # size bound is enforced after writes by dropping the least recently
+    # used entries. A hit is a plain read; `used_at` is refreshed at most
+    # every `touch_seconds` per entry, which is all the LRU order needs.
+    def __init__(self, collection, max_entries: int = 10000, ttl_seconds: float = 3600,
+                 touch_seconds: float = 60):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.touch_seconds = touch_seconds
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("key", unique=True)
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+        await self.collection.create_index("used_at")
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        now = datetime.now(timezone.utc)
+        doc = await self.collection.find_one(
+            {"key": key, "expires_at": {"$gt": now}},
+            {"_id": 0, "value": 1, "stored_at": 1, "expires_at": 1, "used_at": 1}
+        )
+        if doc is None:
+            return None
+        if now - doc["used_at"].replace(tzinfo=timezone.utc) >= timedelta(seconds=self.touch_seconds):
+            await self.collection.update_one({"key": key}, {"$set": {"used_at": now}})
+        expires_at = doc["expires_at"].replace(tzinfo=timezone.utc).timestamp()
+        return CacheEntry(doc["value"], doc["stored_at"], expires_at)
+
+    async def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        now = datetime.now(timezone.utc)
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        await self.collection.update_one(
+            {"key": key},
+            {"$set": {
+                "value": value,
+                "stored_at": time.time(),
+                "used_at": now,
+                "expires_at": now + timedelta(seconds=ttl)
+            }},
+            upsert=True
+        )
+        await self._evict()
+
+    async def delete(self, key: str):
+        await self.collection.delete_one({"key": key})
+
+    async def clear(self):
+        await self.collection.delete_many({})
+
+    async def _evict(self):
+        excess = await self.collection.estimated_document_count() - self.max_entries
+        if excess <= 0:
+            return
+        stale = await self.collection.find({}, {"_id": 1}).sort("used_at", 1).limit(excess).to_list(excess)
+        await self.collection.delete_many({"_id": {"$in": [doc["_id"] for doc in stale]}})
+
+
+class ReadThroughCache:
+    # A load that was already running when its key is invalidated does not
+    # store its (possibly stale) result. Invalidation only reaches the
+    # backend it is made on, so callers that need writes from other workers
+    # pass a version that those writes change (e.g. a per-user counter).
+    def __init__(self, backend, prefix: str):
+        self.backend = backend
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self._loads = {}
+
+    async def get(self, key: str, load: Callable[[], Awaitable[Any]], version: Any = None) -> Any:
+        cache_key = f"{self.prefix}:{key}"
+        entry = await self.backend.get(cache_key)
+        if entry is not None and entry.value["version"] == version:
+            self.hits += 1
+            return entry.value["value"]
+        self.misses += 1
+
+        marker = object()
+        self._loads.setdefault(cache_key, set()).add(marker)
+        try:
+            value = await load()
+        finally:
+            loads = self._loads.get(cache_key, set())
+            current = marker in loads
+            loads.discard(marker)
+            if not loads:
+                self._loads.pop(cache_key, None)
+        if current:
+            await self.backend.set(cache_key, {"version": version, "value": value})
+        return value
+
+    async def invalidate(self, key: str):
+        cache_key = f"{self.prefix}:{key}"
+        self._loads.pop(cache_key, None)
+        await self.backend.delete(cache_key)
@@ -0,0 +1,94 @@
+"""Habit/mood correlation statistics computed with NumPy.
+
+The window is turned into a day x habit completion matrix and a mood vector
+(NaN on days without a mood entry). Every statistic is then computed for all
+habits at once with matrix operations:
+
+- mood_lift: mean mood on days the habit was completed minus mean mood on
+  days it was not
+- correlation: point-biserial correlation between completion and mood
+- next_day_lift / next_day_correlation: the same, pairing completion on one
+  day with mood on the following day
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import numpy as np
+
+
+def build_matrix(rollups: List[dict], habit_ids: List[str], start, days: int):
+    column = {habit_id: j for j, habit_id in enumerate(habit_ids)}
+    completion = np.zeros((days, len(habit_ids)), dtype=np.float64)
+    mood = np.full(days, np.nan)
+    for day in rollups:
+        try:
+            i = (datetime.fromisoformat(day["date"]).date() - start).days
+        except ValueError:
+            continue
+        if not 0 <= i < days:
+            continue
+        for habit_id in day["completed_habit_ids"]:
+            j = column.get(habit_id)
+            if j is not None:
+                completion[i, j] = 1.0
+        if day.get("mood_level") is not None:
+            mood[i] = day["mood_level"]
+    return completion, mood
+
+
+def _effects(completion: np.ndarray, mood: np.ndarray) -> Dict[str, np.ndarray]:
+    # Only days with a mood entry take part
+    observed = ~np.isnan(mood)
+    x = completion[observed]
+    y = mood[observed]
+    n = len(y)
+    habits = completion.shape[1]
+    if n == 0:
+        empty = np.full(habits, np.nan)
+        return {"n": np.zeros(habits), "mood_with": empty, "mood_without": empty, "lift": empty, "r": empty}
+
+    done = x.sum(axis=0)
+    not_done = n - done
+    mood_sum_done = x.T @ y
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mood_with = mood_sum_done / done
+        mood_without = (y.sum() - mood_sum_done) / not_done
+        # Pearson r with a 0/1 variable is the point-biserial correlation
+        covariance = (x - x.mean(axis=0)).T @ (y - y.mean()) / n
+        r = covariance / (x.std(axis=0) * y.std())
+    r[~np.isfinite(r)] = np.nan
+    return {"n": done, "mood_with": mood_with, "mood_without": mood_without, "lift": mood_with - mood_without, "r": r}
+
+
+def _number(value, digits: int = 2):
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+def habit_mood_correlations(rollups: List[dict], habits: List[dict], start, end) -> dict:
+    days = (end - start).days + 1
+    habit_ids = [habit["id"] for habit in habits]
+    completion, mood = build_matrix(rollups, habit_ids, start, days)
+    same_day = _effects(completion, mood)
+    next_day = _effects(completion[:-1], mood[1:])
+
+    results = []
+    for j, habit in enumerate(habits):
+        results.append({
+            "habit_id": habit["id"],
+            "name": habit["name"],
+            "days_completed": int(completion[:, j].sum()),
+            "mood_days_completed": int(same_day["n"][j]),
+            "mood_with": _number(same_day["mood_with"][j]),
+            "mood_without": _number(same_day["mood_without"][j]),
+            "mood_lift": _number(same_day["lift"][j]),
+            "correlation": _number(same_day["r"][j], 3),
+            "next_day_lift": _number(next_day["lift"][j]),
+            "next_day_correlation": _number(next_day["r"][j], 3)
+        })
+    return {
+        "from": start.isoformat(),
+        "to": (start + timedelta(days=days - 1)).isoformat(),
+        "days": days,
+        "mood_days": int((~np.isnan(mood)).sum()),
+        "habits": results
+    }
@@ -0,0 +1,260 @@
+"""How dates are stored in MongoDB.
+
+Calendar days (`date` on habit logs, mood logs and daily rollups) are stored
+as BSON dates at UTC midnight, and `created_at` on users, habits, habit logs
+and mood logs as BSON dates. The API keeps exchanging YYYY-MM-DD and ISO 8601
+strings: `to_db_day` / `to_db_time` convert values on the way in and
+`decode_dates` converts documents on the way out.
+
+Databases created before this stored strings, which `migrate_dates` converts
+in batches while the API keeps serving. Until the migration has finished,
+DateStorage.native is False and queries cover both representations:
+equality matches use `$in` with both values, and `find` / `stream` run the
+query once per type and merge the two sorted results. Writes always store
+BSON dates, so every document the API writes is converted as it goes.
+"""
+import asyncio
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+MIGRATION_ID = "native_dates"
+
+DAY_FIELDS = ("date",)
+TIME_FIELDS = ("created_at",)
+
+Build = Callable[[Callable[[str], object]], dict]
+
+
+def to_db_day(value) -> datetime:
+    # Raises ValueError for anything but a YYYY-MM-DD day (ISO times, basic
+    # and week dates included)
+    if isinstance(value, datetime):
+        return value
+    return datetime.strptime(value, "%Y-%m-%d")
+
+
+def normalize_day(value: str) -> str:
+    # The day as it is written back, e.g. "2024-1-2" -> "2024-01-02"
+    return to_db_day(value).date().isoformat()
+
+
+def to_db_time(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def stored_day(value):
+    # For values read back from the database: valid days as BSON dates,
+    # anything else as it was
+    try:
+        return to_db_day(value)
+    except ValueError:
+        return value
+
+
+def from_db_day(value):
+    return value.date().isoformat() if isinstance(value, datetime) else value
+
+
+def from_db_time(value):
+    if not isinstance(value, datetime):
+        return value
+    return (value if value.tzinfo else value.replace(tzinfo=timezone.utc)).isoformat()
+
+
+def decode_dates(doc: dict) -> dict:
+    # In place; strings left over from before the migration pass through
+    for field in DAY_FIELDS:
+        if field in doc:
+            doc[field] = from_db_day(doc[field])
+    for field in TIME_FIELDS:
+        if field in doc:
+            doc[field] = from_db_time(doc[field])
+    return doc
+
+
+def as_string(value: str) -> str:
+    return value
+
+
+async def merge_sorted(streams: List[AsyncIterator[dict]], key, reverse: bool) -> AsyncIterator[dict]:
+    heads = [await anext(stream, None) for stream in streams]
+    while True:
+        candidates = [i for i, head in enumerate(heads) if head is not None]
+        if not candidates:
+            return
+        pick = (max if reverse else min)(candidates, key=lambda i: key(heads[i]))
+        yield heads[pick]
+        heads[pick] = await anext(streams[pick], None)
+
+
+class DateStorage:
+    def __init__(self):
+        self.native = False
+
+    async def load(self, db):
+        # Native once the migration has finished, or straight away for a
+        # database that has no data yet
+        marker = await db.migrations.find_one({"_id": MIGRATION_ID}, {"completed_at": 1})
+        if marker and marker.get("completed_at"):
+            self.native = True
+            return
+        counts = await asyncio.gather(*(db[name].estimated_document_count() for name in MIGRATED_FIELDS))
+        if not any(counts):
+            await db.migrations.update_one(
+                {"_id": MIGRATION_ID}, {"$set": {"completed_at": datetime.now(timezone.utc)}}, upsert=True
+            )
+            self.native = True
+
+    def match_day(self, value: str):
+        return to_db_day(value) if self.native else {"$in": [value, to_db_day(value)]}
+
+    def match_days(self, values: Iterable[str]) -> dict:
+        values = list(values)
+        native = [to_db_day(value) for value in values]
+        return {"$in": native if self.native else values + native}
+
+    def day_expression(self, field: str):
+        # For aggregation stages that group or compare on a day field;
+        # strings that are not dates are kept as they are
+        return field if self.native else {"$convert": {"input": field, "to": "date", "onError": field}}
+
+    async def stream(self, collection, build: Build, projection: dict, sort: list,
+                     limit: Optional[int] = None) -> AsyncIterator[dict]:
+        # `build` gets a function that turns a YYYY-MM-DD string into the
+        # stored representation and returns the query. `sort` is a list of
+        # (field, direction) pairs in one direction, led by the date field.
+        def cursor(encode, bson_type: Optional[str] = None):
+            query = build(encode)
+            if bson_type:
+                query = {**query, "$and": [*query.get("$and", []), {sort[0][0]: {"$type": bson_type}}]}
+            found = collection.find(query, projection).sort(sort)
+            return found.limit(limit) if limit else found
+
+        if self.native:
+            async for doc in cursor(to_db_day):
+                yield decode_dates(doc)
+            return
+
+        fields = [field for field, _ in sort]
+        streams = [
+            (decode_dates(doc) async for doc in cursor(as_string, "string")),
+            (decode_dates(doc) async for doc in cursor(to_db_day, "date"))
+        ]
+        merged = merge_sorted(streams, lambda doc: tuple(doc.get(field) for field in fields), sort[0][1] < 0)
+        count = 0
+        async for doc in merged:
+            yield doc
+            count += 1
+            if limit and count >= limit:
+                return
+
+    async def find(self, collection, build: Build, projection: dict, sort: list,
+                   limit: Optional[int] = None) -> List[dict]:
+        return [doc async for doc in self.stream(collection, build, projection, sort, limit)]
+
+
+# ============ MIGRATION ============
+
+MIGRATED_FIELDS: Dict[str, Dict[str, Callable]] = {
+    "users": {"created_at": to_db_time},
+    "habits": {"created_at": to_db_time},
+    "habit_logs": {"date": to_db_day, "created_at": to_db_time},
+    "mood_logs": {"date": to_db_day, "created_at": to_db_time},
+    "daily_rollups": {"date": to_db_day}
+}
+
+
+async def convert_batch(collection, fields: Dict[str, Callable], docs: List[dict]) -> Dict[str, int]:
+    counts = {"converted": 0, "invalid": 0, "duplicates": 0}
+    filters, ops = [], []
+    for doc in docs:
+        try:
+            update = {field: convert(doc[field]) for field, convert in fields.items()
+                      if isinstance(doc.get(field), str)}
+        except ValueError:
+            counts["invalid"] += 1
+            continue
+        # Only while the document still holds the values read, so a
+        # concurrent write from the API is never overwritten
+        filters.append({"_id": doc["_id"], **{field: doc[field] for field in update}})
+        ops.append(UpdateOne(filters[-1], {"$set": update}))
+    if not ops:
+        return counts
+    try:
+        counts["converted"] = (await collection.bulk_write(ops, ordered=False)).modified_count
+    except BulkWriteError as e:
+        counts["converted"] = e.details.get("nModified", 0)
+        for error in e.details.get("writeErrors", []):
+            if error.get("code") != 11000:
+                raise
+            # The API already wrote this key with a native date, which is
+            # newer than the legacy copy
+            counts["duplicates"] += (await collection.delete_one(filters[error["index"]])).deleted_count
+    return counts
+
+
+async def migrate_dates(db, batch_size: int = 1000, pause_seconds: float = 0.0,
+                        report: Optional[Callable[[str, dict], None]] = None) -> dict:
+    # Walks each collection in _id order, saving a checkpoint after every
+    # batch, so an interrupted run resumes where it stopped. Passes repeat
+    # until one converts nothing, which picks up strings written by API
+    # instances still running older code. Values that are not valid dates
+    # are counted and left as they are.
+    state = await db.migrations.find_one({"_id": MIGRATION_ID}) or {}
+    if state.get("completed_at"):
+        return {"completed": True, "already_completed": True}
+    checkpoints = state.get("checkpoints", {})
+    pass_converted = state.get("pass_converted", 0)
+    totals = {"converted": 0, "invalid": 0, "duplicates": 0}
+
+    while True:
+        # Invalid values are met again on every pass; count the last one's
+        totals["invalid"] = 0
+        for name, fields in MIGRATED_FIELDS.items():
+            collection = db[name]
+            legacy = {"$or": [{field: {"$type": "string"}} for field in fields]}
+            last_id = checkpoints.get(name)
+            position = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            progress = {"pass_total": await collection.count_documents({**legacy, **position}), "scanned": 0,
+                        "converted": 0, "invalid": 0, "duplicates": 0}
+            while True:
+                query = {**legacy, "_id": {"$gt": last_id}} if last_id is not None else legacy
+                docs = await collection.find(query, {"_id": 1, **{field: 1 for field in fields}}) \
+                    .sort("_id", 1).limit(batch_size).to_list(batch_size)
+                if not docs:
+                    break
+                counts = await convert_batch(collection, fields, docs)
+                for key, value in counts.items():
+                    progress[key] += value
+                    totals[key] += value
+                progress["scanned"] += len(docs)
+                pass_converted += counts["converted"] + counts["duplicates"]
+                last_id = docs[-1]["_id"]
+                checkpoints[name] = last_id
+                await db.migrations.update_one({"_id": MIGRATION_ID}, {"$set": {
+                    f"checkpoints.{name}": last_id,
+                    "pass_converted": pass_converted,
+                    "updated_at": datetime.now(timezone.utc)
+                }}, upsert=True)
+                if report:
+                    report(name, progress)
+                if pause_seconds:
+                    await asyncio.sleep(pause_seconds)
+
+        if not pass_converted:
+            break
+        checkpoints, pass_converted = {}, 0
+        await db.migrations.update_one(
+            {"_id": MIGRATION_ID}, {"$set": {"checkpoints": {}, "pass_converted": 0}}, upsert=True
+        )
+
+    await db.migrations.update_one(
+        {"_id": MIGRATION_ID}, {"$set": {"completed_at": datetime.now(timezone.utc)}}, upsert=True
+    )
+    return {"completed": True, **totals}
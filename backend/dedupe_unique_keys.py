@@ -0,0 +1,24 @@
+"""Remove duplicate documents that would block the unique indexes.
+
+Keeps the newest document for every duplicated key of users (email),
+habit_logs (user_id, habit_id, date), mood_logs (user_id, date),
+daily_rollups and data_versions. Run it before starting an API version that
+builds these indexes on a database written without them.
+
+Usage (from the backend directory):
+    python dedupe_unique_keys.py
+"""
+import asyncio
+
+from server import client, dedupe_unique_keys, logger
+
+
+async def main():
+    removed = await dedupe_unique_keys()
+    for collection, count in removed.items():
+        logger.info(f"{collection}: removed {count} duplicate document(s)")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
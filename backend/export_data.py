@@ -0,0 +1,38 @@
+"""Export habits, habit logs, mood logs and settings for backups.
+
+Records are streamed from MongoDB to the output file, so memory use does not
+depend on the amount of data. Output is gzip-compressed when the file name
+ends in .gz.
+
+Usage (from the backend directory):
+    python export_data.py OUTPUT [--format ndjson|csv] [--user-id USER_ID]
+"""
+import argparse
+import asyncio
+
+from exports import encode, gzip_chunks
+from imports import FORMATS
+from server import client, date_storage, db, export_records, logger
+
+
+async def main(output, format="ndjson", user_id=None):
+    await date_storage.load(db)
+    body = encode(export_records(user_id), format)
+    if output.endswith(".gz"):
+        body = gzip_chunks(body)
+    written = 0
+    with open(output, "wb") as f:
+        async for chunk in body:
+            f.write(chunk)
+            written += len(chunk)
+    logger.info(f"Wrote {written} bytes to {output}")
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", help="File to write; compressed when it ends in .gz")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--user-id", help="Only export this user's data")
+    args = parser.parse_args()
+    asyncio.run(main(args.output, args.format, args.user_id))
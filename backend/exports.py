@@ -0,0 +1,67 @@
+"""Streaming encoders for data exports.
+
+An export is an async stream of (record_type, document) pairs. `encode`
+turns it into NDJSON or CSV bytes and `gzip_chunks` compresses a byte stream
+on the fly. Output is yielded in chunks of roughly CHUNK_BYTES, so memory
+use stays flat no matter how many records pass through.
+
+NDJSON lines are the documents with a "type" field added. CSV output uses a
+single header covering every record type, with a "type" column first and
+empty cells for fields a record does not have.
+"""
+import csv
+import io
+import zlib
+from typing import AsyncIterator, Tuple
+
+import orjson
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+CHUNK_BYTES = 64 * 1024
+
+CSV_COLUMNS = [
+    "type", "id", "user_id", "habit_id", "name", "color", "date", "completed",
+    "mood_level", "emoji", "note", "current_streak", "longest_streak",
+    "last_completed", "theme", "color_palette", "created_at", "updated_at"
+]
+
+Record = Tuple[str, dict]
+
+
+async def encode_ndjson(records: AsyncIterator[Record]) -> AsyncIterator[bytes]:
+    buffer = bytearray()
+    async for record_type, doc in records:
+        buffer += orjson.dumps({"type": record_type, **doc})
+        buffer += b"\n"
+        if len(buffer) >= CHUNK_BYTES:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+async def encode_csv(records: AsyncIterator[Record]) -> AsyncIterator[bytes]:
+    text = io.StringIO()
+    writer = csv.DictWriter(text, CSV_COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    async for record_type, doc in records:
+        writer.writerow({**doc, "type": record_type})
+        if text.tell() >= CHUNK_BYTES:
+            yield text.getvalue().encode("utf-8")
+            text.seek(0)
+            text.truncate()
+    if text.tell():
+        yield text.getvalue().encode("utf-8")
+
+
+def encode(records: AsyncIterator[Record], format: str) -> AsyncIterator[bytes]:
+    return encode_ndjson(records) if format == "ndjson" else encode_csv(records)
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
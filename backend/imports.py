@@ -0,0 +1,56 @@
+"""Incremental parsing of uploaded NDJSON and CSV files.
+
+`iter_records` reads a request body chunk by chunk and yields one record per
+line, so an upload never has to fit in memory. Every record is a
+(line_number, fields, error) tuple: `fields` is a dict of the raw values and
+`error` is set instead when the line cannot be parsed. CSV files need a
+header row naming the fields; quoted values may not span lines.
+"""
+import csv
+import json
+from typing import AsyncIterator, Optional, Tuple
+
+FORMATS = ("ndjson", "csv")
+
+Record = Tuple[int, Optional[dict], Optional[str]]
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8-sig").rstrip("\r")
+
+
+async def iter_records(chunks: AsyncIterator[bytes], format: str) -> AsyncIterator[Record]:
+    header = None
+    line_number = 0
+    async for line in iter_lines(chunks):
+        line_number += 1
+        if not line.strip():
+            continue
+        if format == "ndjson":
+            try:
+                fields = json.loads(line)
+            except ValueError:
+                yield line_number, None, "Invalid JSON"
+                continue
+            if not isinstance(fields, dict):
+                yield line_number, None, "Expected a JSON object"
+                continue
+            yield line_number, fields, None
+            continue
+
+        row = next(csv.reader([line]))
+        if header is None:
+            header = [name.strip() for name in row]
+            continue
+        if len(row) > len(header):
+            yield line_number, None, f"Expected at most {len(header)} columns, got {len(row)}"
+            continue
+        # Empty and missing trailing cells fall back to the model's defaults
+        yield line_number, {name: value for name, value in zip(header, row) if value != ""}, None
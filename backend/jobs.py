@@ -0,0 +1,146 @@
+"""In-process background job queue with bounded concurrency.
+
+A fixed number of worker tasks pull jobs off an asyncio queue, so at most
+`concurrency` jobs run at once no matter how many are submitted. Each run is
+cut off after `timeout_seconds`. Submitting a key that already has a pending
+or running job returns that job instead of queueing a duplicate. Finished
+jobs are kept for `result_ttl_seconds` so clients can poll for the result.
+
+Work the caller runs itself, such as a response streamed to a client, goes
+through `running`: it takes a slot from the same pool and is registered
+under its key, so the concurrency limit covers both paths and identical
+submissions wait for it instead of running twice.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class Job:
+    key: str
+    run: Optional[Callable[[], Awaitable[Any]]]
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    owners: Set[str] = field(default_factory=set)
+    status: str = PENDING
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+
+class JobQueue:
+    def __init__(self, concurrency: int = 4, timeout_seconds: float = 60, result_ttl_seconds: float = 3600):
+        self.concurrency = concurrency
+        self.timeout_seconds = timeout_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        self._queue = None
+        self._workers = []
+        self._jobs: Dict[str, Job] = {}
+        self._active: Dict[str, Job] = {}
+        self.slots = asyncio.Semaphore(concurrency)
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, key: str, owner: str, run: Callable[[], Awaitable[Any]]) -> Job:
+        self._prune()
+        job = self._active.get(key)
+        if job is None:
+            job = Job(key=key, run=run)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            self._queue.put_nowait(job)
+        job.owners.add(owner)
+        return job
+
+    def active(self, key: str) -> Optional[Job]:
+        return self._active.get(key)
+
+    @asynccontextmanager
+    async def running(self, key: str, owner: str) -> AsyncIterator[Job]:
+        # The caller sets job.result, or job.error to mark it failed
+        self._prune()
+        job = Job(key=key, run=None, owners={owner})
+        self._jobs[job.id] = job
+        self._active[key] = job
+        try:
+            async with self.slots:
+                job.status = RUNNING
+                yield job
+            job.status = FAILED if job.error else DONE
+        except BaseException as e:
+            job.status = FAILED
+            job.error = job.error or str(e) or type(e).__name__
+            raise
+        finally:
+            job.finished_at = time.time()
+            self._active.pop(key, None)
+            job.done.set()
+
+    def get(self, job_id: str, owner: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is None or owner not in job.owners:
+            return None
+        return job
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                async with self.slots:
+                    job.status = RUNNING
+                    job.result = await asyncio.wait_for(job.run(), self.timeout_seconds)
+                job.status = DONE
+            except asyncio.TimeoutError:
+                job.status = FAILED
+                job.error = f"Timed out after {self.timeout_seconds}s"
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {str(e)}")
+                job.status = FAILED
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+                job.run = None
+                self._active.pop(job.key, None)
+                job.done.set()
+                self._queue.task_done()
+
+    def _prune(self):
+        cutoff = time.time() - self.result_ttl_seconds
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
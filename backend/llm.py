@@ -0,0 +1,84 @@
+"""LLM clients for AI insights.
+
+`create_llm_client` picks the implementation from the LLM_CLIENT environment
+variable: "emergent" (default) talks to the real model, "stub" returns a
+canned reply after an optional delay so the insights flow can be exercised
+offline. Clients that can stream expose `stream()`; `stream_completion`
+falls back to a single chunk for those that cannot.
+
+The emergentintegrations package pulls in several provider SDKs and is slow
+to import, so it is only loaded on first use; `warm_up()` loads it ahead of
+time on a worker thread.
+"""
+import asyncio
+import importlib
+import os
+from typing import AsyncIterator
+
+
+def load_chat_module():
+    return importlib.import_module("emergentintegrations.llm.chat")
+
+
+class EmergentLlmClient:
+    def __init__(self, api_key: str, provider: str = "openai", model: str = "gpt-5"):
+        self.api_key = api_key
+        self.provider = provider
+        self.model = model
+
+    async def warm_up(self):
+        await asyncio.to_thread(load_chat_module)
+
+    async def complete(self, session_id: str, system_message: str, prompt: str) -> str:
+        chat_module = load_chat_module()
+        chat = chat_module.LlmChat(
+            api_key=self.api_key,
+            session_id=session_id,
+            system_message=system_message
+        ).with_model(self.provider, self.model)
+        return await chat.send_message(chat_module.UserMessage(text=prompt))
+
+
+class StubLlmClient:
+    def __init__(self, delay_seconds: float = 0.0, reply: str = None, chunk_words: int = 3):
+        self.delay_seconds = delay_seconds
+        self.reply = reply
+        self.chunk_words = chunk_words
+        self.calls = 0
+
+    async def warm_up(self):
+        pass
+
+    def _reply_for(self, prompt: str) -> str:
+        if self.reply is not None:
+            return self.reply
+        return f"[stub insights] {len(prompt)} characters of habit and mood data received."
+
+    async def complete(self, session_id: str, system_message: str, prompt: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.delay_seconds)
+        return self._reply_for(prompt)
+
+    async def stream(self, session_id: str, system_message: str, prompt: str) -> AsyncIterator[str]:
+        # Spread the delay over the chunks to mimic token-by-token output
+        self.calls += 1
+        words = self._reply_for(prompt).split(" ")
+        chunks = [" ".join(words[i:i + self.chunk_words]) for i in range(0, len(words), self.chunk_words)]
+        for i, chunk in enumerate(chunks):
+            await asyncio.sleep(self.delay_seconds / len(chunks))
+            yield chunk if i == 0 else " " + chunk
+
+
+async def stream_completion(client, session_id: str, system_message: str, prompt: str) -> AsyncIterator[str]:
+    stream = getattr(client, "stream", None)
+    if stream is None:
+        yield await client.complete(session_id, system_message, prompt)
+        return
+    async for chunk in stream(session_id, system_message, prompt):
+        yield chunk
+
+
+def create_llm_client():
+    if os.environ.get('LLM_CLIENT', 'emergent') == 'stub':
+        return StubLlmClient(float(os.environ.get('LLM_STUB_DELAY_SECONDS', 0)))
+    return EmergentLlmClient(os.environ['EMERGENT_LLM_KEY'])
@@ -0,0 +1,192 @@
+"""Prometheus metrics for the API.
+
+- PrometheusMiddleware: per-route request counts, latency histograms and
+  in-flight gauges. Routes are labelled with their path template
+  (/api/habits/{habit_id}), so label cardinality stays fixed.
+- MongoCommandMetrics: a PyMongo command listener counting and timing every
+  command the client sends, per collection and command name.
+- LLM_LATENCY / LLM_ERRORS, BCRYPT_SECONDS: timings for the slow paths,
+  recorded by server.py.
+- register_cache: exposes a ReadThroughCache's hit and miss counts.
+- register_write_buffer: exposes how many values a WriteBehindBuffer took in
+  and how many it wrote after coalescing.
+- monitor_event_loop: samples how late the event loop wakes up from a sleep,
+  which grows when something blocks the loop.
+
+`metrics_response` renders everything in the Prometheus text format.
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily
+from pymongo import monitoring
+from starlette.responses import Response
+from starlette.routing import Match
+
+HTTP_REQUESTS = Counter(
+    "habitmap_http_requests_total", "HTTP requests handled", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "habitmap_http_request_duration_seconds", "Time to send the full HTTP response", ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+HTTP_IN_FLIGHT = Gauge(
+    "habitmap_http_requests_in_flight", "HTTP requests currently being handled", ["method", "route"]
+)
+MONGO_COMMANDS = Counter(
+    "habitmap_mongo_commands_total", "MongoDB commands sent", ["collection", "command", "outcome"]
+)
+MONGO_LATENCY = Histogram(
+    "habitmap_mongo_command_duration_seconds", "MongoDB command round trip time", ["collection", "command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+LLM_LATENCY = Histogram(
+    "habitmap_llm_call_duration_seconds", "LLM call time, to the last chunk when streaming", ["operation"],
+    buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+)
+LLM_ERRORS = Counter("habitmap_llm_call_errors_total", "Failed LLM calls", ["operation"])
+BCRYPT_SECONDS = Histogram(
+    "habitmap_bcrypt_duration_seconds", "Time spent hashing or verifying a password", ["operation"],
+    buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1, 2)
+)
+EVENT_LOOP_LAG = Histogram(
+    "habitmap_event_loop_lag_seconds", "How late the event loop wakes up from a sleep",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+
+
+@contextmanager
+def observe(histogram, errors=None, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        # Including cancellation: a call cut off by asyncio.wait_for, as
+        # job timeouts are, fails with CancelledError inside the block
+        if errors is not None:
+            errors.labels(**labels).inc()
+        raise
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - started)
+
+
+def route_template(app, scope) -> str:
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+
+class PrometheusMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        route = route_template(scope["app"], scope)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+            in_flight.dec()
+
+
+def command_collection(event) -> str:
+    # Most commands name their collection as the command's value; getMore
+    # names it in a separate field
+    target = event.command.get("collection") if event.command_name == "getMore" else event.command.get(event.command_name)
+    return target if isinstance(target, str) else ""
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        self._collections[(event.request_id, event.connection_id)] = command_collection(event)
+
+    def _finish(self, event, outcome: str):
+        collection = self._collections.pop((event.request_id, event.connection_id), "")
+        MONGO_COMMANDS.labels(collection, event.command_name, outcome).inc()
+        MONGO_LATENCY.labels(collection, event.command_name).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
+
+
+class CacheCollector:
+    # Reads the counters at scrape time, so caches need no metrics code
+    def __init__(self):
+        self.caches = {}
+
+    def collect(self):
+        family = CounterMetricFamily("habitmap_cache_lookups", "Cache lookups", labels=["cache", "result"])
+        for name, cache in self.caches.items():
+            family.add_metric([name, "hit"], cache.hits)
+            family.add_metric([name, "miss"], cache.misses)
+        yield family
+
+
+cache_collector = CacheCollector()
+REGISTRY.register(cache_collector)
+
+
+def register_cache(name: str, cache):
+    cache_collector.caches[name] = cache
+
+
+class WriteBufferCollector:
+    def __init__(self):
+        self.buffers = {}
+
+    def collect(self):
+        puts = CounterMetricFamily("habitmap_write_buffer_puts", "Values put into a write-behind buffer",
+                                   labels=["buffer"])
+        writes = CounterMetricFamily("habitmap_write_buffer_writes", "Values written after coalescing",
+                                     labels=["buffer"])
+        for name, buffer in self.buffers.items():
+            puts.add_metric([name], buffer.puts)
+            writes.add_metric([name], buffer.writes)
+        yield puts
+        yield writes
+
+
+write_buffer_collector = WriteBufferCollector()
+REGISTRY.register(write_buffer_collector)
+
+
+def register_write_buffer(name: str, buffer):
+    write_buffer_collector.buffers[name] = buffer
+
+
+async def monitor_event_loop(interval_seconds: float = 0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval_seconds)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - started - interval_seconds))
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,45 @@
+"""Convert stored date strings to BSON dates (see dates.py).
+
+Safe to run while the API is serving, as long as every API instance already
+runs the code that reads both representations. Progress is checkpointed
+after each batch, so an interrupted run picks up where it stopped. Once it
+finishes, API instances use date-only queries from their next start.
+
+Usage (from the backend directory):
+    python migrate_dates.py [--batch-size 1000] [--pause 0.1]
+"""
+import argparse
+import asyncio
+
+from dates import migrate_dates
+from server import client, db, ensure_indexes, logger
+
+
+def report(collection, progress):
+    total = progress["pass_total"]
+    percent = f" ({min(progress['scanned'] / total, 1) * 100:.1f}%)" if total else ""
+    logger.info(
+        f"{collection}: {progress['scanned']}/{total} scanned{percent}, {progress['converted']} converted, "
+        f"{progress['duplicates']} duplicates removed, {progress['invalid']} invalid"
+    )
+
+
+async def main(batch_size=1000, pause_seconds=0.0):
+    await ensure_indexes()
+    result = await migrate_dates(db, batch_size, pause_seconds, report)
+    if result.get("already_completed"):
+        logger.info("Dates were already migrated")
+    else:
+        logger.info(
+            f"Migration finished: {result['converted']} documents converted, "
+            f"{result['duplicates']} duplicates removed, {result['invalid']} left with invalid dates"
+        )
+    client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--pause", type=float, default=0.0, help="Seconds to wait between batches")
+    args = parser.parse_args()
+    asyncio.run(main(args.batch_size, args.pause))
@@ -0,0 +1,274 @@
+"""Opt-in per-request profiling.
+
+ProfilingMiddleware profiles a request when it carries a valid X-Profile
+header (see `sign_profile_header`) or is picked by the sampling rate. While
+the request runs, a background thread samples the event loop thread's stack
+every few milliseconds and keeps the samples taken inside that request, and
+`phase()` blocks record how long named steps took: auth, every MongoDB
+command (through ProfilingCommandListener), response validation and JSON
+rendering. Finished profiles go to a ProfileStore, which keeps the most
+recent ones and writes each stack profile as a folded-stacks file that
+flamegraph.pl and speedscope can read.
+
+Only work done on the request's own task is sampled; threads (bcrypt,
+Motor I/O) show up as time spent awaiting them.
+
+To sign a header valid for an hour:
+    python -c "import profiling; print(profiling.sign_profile_header('<ADMIN_TOKEN>'))"
+"""
+import hashlib
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+import fastapi.routing
+from fastapi.responses import JSONResponse
+from pymongo import monitoring
+
+from metrics import command_collection, route_template
+
+MAX_PHASES = 1000  # per request; later phases are dropped
+
+current_profile: ContextVar = ContextVar("current_profile", default=None)
+
+
+def sign_profile_header(secret: str, ttl_seconds: int = 3600) -> str:
+    expires = str(int(time.time()) + ttl_seconds)
+    signature = hmac.new(secret.encode("utf-8"), expires.encode("ascii"), hashlib.sha256).hexdigest()
+    return f"{expires}:{signature}"
+
+
+def verify_profile_header(secret: str, value: str) -> bool:
+    expires, _, signature = value.partition(":")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    expected = hmac.new(secret.encode("utf-8"), expires.encode("ascii"), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature, expected)
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, trigger: str):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.route = None
+        self.status = None
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.phases = []
+        self.stacks = Counter()
+
+    def add_phase(self, name: str, start: float, duration: float):
+        if len(self.phases) < MAX_PHASES:
+            self.phases.append((name, start - self.started, duration))
+
+    def finish(self, route: str, status: int):
+        self.route = route
+        self.status = status
+        self.duration = time.perf_counter() - self.started
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self) -> dict:
+        totals = Counter()
+        for name, _, duration in self.phases:
+            totals[name.split(" ")[0]] += duration
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "trigger": self.trigger,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 2),
+            "samples": sum(self.stacks.values()),
+            "phase_totals_ms": {name: round(total * 1000, 2) for name, total in totals.most_common()},
+            "phases": [
+                {"name": name, "start_ms": round(start * 1000, 2), "duration_ms": round(duration * 1000, 2)}
+                for name, start, duration in self.phases
+            ]
+        }
+
+
+@contextmanager
+def phase(name: str):
+    profile = current_profile.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_phase(name, start, time.perf_counter() - start)
+
+
+def describe_frame(frame) -> str:
+    code = frame.f_code
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    # One thread serves every profiled request and exits when none are
+    # active. A request's samples are the stacks that pass through the
+    # middleware frame it started in, cut at that frame.
+    def __init__(self, interval_seconds: float = 0.005):
+        self.interval_seconds = interval_seconds
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, marker, thread_id: int, profile: RequestProfile):
+        with self._lock:
+            self._active[marker] = (thread_id, profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+
+    def remove(self, marker):
+        with self._lock:
+            self._active.pop(marker, None)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                active = list(self._active.items())
+            frames = sys._current_frames()
+            for marker, (thread_id, profile) in active:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None and frame is not marker:
+                    stack.append(frame)
+                    frame = frame.f_back
+                if frame is marker and stack:
+                    profile.stacks[";".join(describe_frame(f) for f in reversed(stack))] += 1
+            del frames
+            time.sleep(self.interval_seconds)
+
+
+class ProfileStore:
+    def __init__(self, directory: str, max_profiles: int = 200):
+        self.directory = Path(directory)
+        self._profiles = deque(maxlen=max_profiles)
+
+    def path_for(self, profile_id: str) -> Path:
+        return self.directory / f"{profile_id}.folded"
+
+    def add(self, profile: RequestProfile):
+        if len(self._profiles) == self._profiles.maxlen:
+            self.path_for(self._profiles[0].id).unlink(missing_ok=True)
+        self._profiles.append(profile)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path_for(profile.id).write_text(profile.folded())
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        return next((profile for profile in self._profiles if profile.id == profile_id), None)
+
+    def slowest(self, limit: int) -> list:
+        return sorted(self._profiles, key=lambda profile: profile.duration, reverse=True)[:limit]
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, store: ProfileStore, secret: Optional[str] = None, sample_rate: float = 0.0,
+                 interval_seconds: float = 0.005):
+        self.app = app
+        self.store = store
+        self.secret = secret
+        self.sample_rate = sample_rate
+        self.sampler = StackSampler(interval_seconds)
+
+    def _trigger(self, scope) -> Optional[str]:
+        if self.secret:
+            header = dict(scope["headers"]).get(b"x-profile")
+            if header and verify_profile_header(self.secret, header.decode("latin-1")):
+                return "header"
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        trigger = self._trigger(scope) if scope["type"] == "http" else None
+        if trigger is None:
+            return await self.app(scope, receive, send)
+
+        profile = RequestProfile(scope["method"], scope["path"], trigger)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token = current_profile.set(profile)
+        marker = sys._getframe()
+        self.sampler.add(marker, threading.get_ident(), profile)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            self.sampler.remove(marker)
+            current_profile.reset(token)
+            profile.finish(route_template(scope["app"], scope), status)
+            self.store.add(profile)
+
+
+class ProfilingCommandListener(monitoring.CommandListener):
+    # Motor runs commands on its thread pool with a copy of the caller's
+    # context, so current_profile is visible here
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        if current_profile.get() is not None:
+            self._collections[(event.request_id, event.connection_id)] = command_collection(event)
+
+    def _finish(self, event, suffix: str = ""):
+        profile = current_profile.get()
+        if profile is None:
+            return
+        collection = self._collections.pop((event.request_id, event.connection_id), "")
+        duration = event.duration_micros / 1e6
+        profile.add_phase(f"mongo {event.command_name} {collection}{suffix}", time.perf_counter() - duration, duration)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, " (failed)")
+
+
+class ProfiledJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        with phase("render"):
+            return super().render(content)
+
+
+def instrument_fastapi():
+    # FastAPI validates and encodes return values through this module-level
+    # function; wrap it so profiles show that step on its own
+    serialize_response = fastapi.routing.serialize_response
+    if getattr(serialize_response, "profiled", False):
+        return
+
+    async def profiled_serialize_response(*args, **kwargs):
+        with phase("serialize"):
+            return await serialize_response(*args, **kwargs)
+
+    profiled_serialize_response.profiled = True
+    fastapi.routing.serialize_response = profiled_serialize_response
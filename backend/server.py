@@ -1,38 +1,173 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, Response, status
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 import os
+import asyncio
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, ValidationError
 from typing import List, Optional
+from collections import Counter
 import uuid
+import base64
+import json
 from datetime import datetime, timezone, timedelta
 import bcrypt
+import orjson
+import hashlib
+import hmac
+import time
+from concurrent.futures import ThreadPoolExecutor
 import jwt
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+from cache import MemoryCache, MongoCache, ReadThroughCache
+from jobs import JobQueue, DONE, FAILED
+from llm import create_llm_client, stream_completion
+from correlations import habit_mood_correlations
+from imports import FORMATS, iter_records
+from exports import MEDIA_TYPES, encode, gzip_chunks
+from writebuffer import WriteBehindBuffer
+from dates import DateStorage, decode_dates, normalize_day, stored_day, to_db_day, to_db_time
+from metrics import (
+    BCRYPT_SECONDS, LLM_ERRORS, LLM_LATENCY, MongoCommandMetrics, PrometheusMiddleware,
+    metrics_response, monitor_event_loop, observe, register_cache, register_write_buffer
+)
+from profiling import (
+    ProfileStore, ProfiledJSONResponse, ProfilingCommandListener, ProfilingMiddleware, instrument_fastapi, phase
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Connections kept open (and opened at startup) so first requests skip the handshake
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 4))
+client = AsyncIOMotorClient(
+    mongo_url,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    event_listeners=[MongoCommandMetrics(), ProfilingCommandListener()]
+)
 db = client[os.environ['DB_NAME']]
+# Days and created_at are BSON dates in the database (see dates.py); loaded
+# at startup, and until migrate_dates.py has finished queries also match the
+# old string values
+date_storage = DateStorage()
 
 # JWT Configuration
 JWT_SECRET = os.environ['JWT_SECRET']
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24 * 7  # 1 week
 
-app = FastAPI()
+# Token verification
+TOKEN_CACHE_MAX_ENTRIES = int(os.environ.get('TOKEN_CACHE_MAX_ENTRIES', 10000))
+REVOCATION_REFRESH_SECONDS = float(os.environ.get('REVOCATION_REFRESH_SECONDS', 30))
+
+# Password hashing
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+BCRYPT_THREADS = int(os.environ.get('BCRYPT_THREADS', 2))
+BCRYPT_MAX_PENDING = int(os.environ.get('BCRYPT_MAX_PENDING', 32))  # running + queued
+
+# Health checks
+READINESS_TIMEOUT_SECONDS = 2
+MONGO_WARM_UP_RETRY_SECONDS = float(os.environ.get('MONGO_WARM_UP_RETRY_SECONDS', 5))
+
+# Pagination
+MAX_PAGE_SIZE = 10000
+
+# Return list endpoints' documents as-is (encoded with orjson) instead of
+# re-validating each one through the response model
+FAST_LIST_RESPONSES = os.environ.get('FAST_LIST_RESPONSES', 'false').lower() == 'true'
+
+# Batch writes and imports
+BATCH_MAX_ENTRIES = int(os.environ.get('BATCH_MAX_ENTRIES', 5000))
+IMPORT_BATCH_SIZE = 1000
+IMPORT_MAX_ERRORS = 100  # per-line errors reported back; the rest are only counted
+
+# Heatmaps
+HEATMAP_DEFAULT_DAYS = 365
+HEATMAP_MAX_DAYS = 366 * 10
+
+# Delta sync
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.environ.get('SYNC_TOMBSTONE_RETENTION_DAYS', 90))
+SYNC_OVERLAP_SECONDS = 5
+
+# AI insights cache
+INSIGHTS_CACHE_BACKEND = os.environ.get('INSIGHTS_CACHE_BACKEND', 'memory')  # memory | mongo
+INSIGHTS_CACHE_TTL_SECONDS = int(os.environ.get('INSIGHTS_CACHE_TTL_SECONDS', 6 * 3600))
+INSIGHTS_CACHE_MAX_ENTRIES = int(os.environ.get('INSIGHTS_CACHE_MAX_ENTRIES', 1000))
+INSIGHTS_PROMPT_VERSION = 2  # bump when the prompt or model changes
+
+if INSIGHTS_CACHE_BACKEND == 'mongo':
+    insights_cache = MongoCache(db.insights_cache, INSIGHTS_CACHE_MAX_ENTRIES, INSIGHTS_CACHE_TTL_SECONDS)
+else:
+    insights_cache = MemoryCache(INSIGHTS_CACHE_MAX_ENTRIES, INSIGHTS_CACHE_TTL_SECONDS)
+
+# AI insights LLM calls
+AI_INSIGHTS_CONCURRENCY = int(os.environ.get('AI_INSIGHTS_CONCURRENCY', 4))
+AI_INSIGHTS_TIMEOUT_SECONDS = float(os.environ.get('AI_INSIGHTS_TIMEOUT_SECONDS', 60))
+
+llm_client = create_llm_client()
+insight_jobs = JobQueue(AI_INSIGHTS_CONCURRENCY, AI_INSIGHTS_TIMEOUT_SECONDS)
+
+token_cache = MemoryCache(TOKEN_CACHE_MAX_ENTRIES, JWT_EXPIRATION_HOURS * 3600)
+
+# Per-user habits and settings, read through on GET and invalidated by every
+# write to them. Entries carry the user's data version, so a worker whose
+# cache missed another worker's invalidation still sees the write.
+USER_CACHE_BACKEND = os.environ.get('USER_CACHE_BACKEND', 'memory')  # memory | mongo
+USER_CACHE_TTL_SECONDS = int(os.environ.get('USER_CACHE_TTL_SECONDS', 300))
+USER_CACHE_MAX_ENTRIES = int(os.environ.get('USER_CACHE_MAX_ENTRIES', 10000))
+
+if USER_CACHE_BACKEND == 'mongo':
+    user_cache = MongoCache(db.user_cache, USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS)
+else:
+    user_cache = MemoryCache(USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS)
+habits_cache = ReadThroughCache(user_cache, "habits")
+settings_cache = ReadThroughCache(user_cache, "settings")
+register_cache("habits", habits_cache)
+register_cache("settings", settings_cache)
+
+# Habit log write-behind: POST /api/habit-logs answers from memory and the
+# upserts are coalesced per (user, habit, date) and written in bulk. Reads
+# and other habit log writes flush the user's pending upserts first.
+HABIT_LOG_WRITE_BEHIND = os.environ.get('HABIT_LOG_WRITE_BEHIND', 'false').lower() == 'true'
+HABIT_LOG_FLUSH_INTERVAL_MS = float(os.environ.get('HABIT_LOG_FLUSH_INTERVAL_MS', 50))
+HABIT_LOG_FLUSH_MAX_ENTRIES = int(os.environ.get('HABIT_LOG_FLUSH_MAX_ENTRIES', 500))
+
+habit_log_writes = WriteBehindBuffer(
+    lambda logs: write_buffered_habit_logs(logs), HABIT_LOG_FLUSH_MAX_ENTRIES, HABIT_LOG_FLUSH_INTERVAL_MS / 1000
+)
+register_write_buffer("habit_logs", habit_log_writes)
+
+bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_THREADS, thread_name_prefix="bcrypt")
+bcrypt_slots = asyncio.Semaphore(BCRYPT_MAX_PENDING)
+
+# Request profiling: requests signed with ADMIN_TOKEN (see profiling.py) or
+# picked at PROFILE_SAMPLE_RATE are profiled; ADMIN_TOKEN also guards the
+# /api/admin routes, which are disabled when it is unset
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp/habitmap-profiles')
+PROFILE_HISTORY = int(os.environ.get('PROFILE_HISTORY', 200))
+
+profile_store = ProfileStore(PROFILE_DIR, PROFILE_HISTORY)
+instrument_fastapi()
+
+app = FastAPI(default_response_class=ProfiledJSONResponse)
 api_router = APIRouter(prefix="/api")
 security = HTTPBearer()
 
 # ============ MODELS ============
 
+def utc_now_iso() -> str:
+    # Fixed-width timestamps so string comparison matches time order
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
 class UserRegister(BaseModel):
     email: EmailStr
     password: str
@@ -54,7 +189,11 @@ class Habit(BaseModel):
     user_id: str
     name: str
     color: str
+    current_streak: int = 0
+    longest_streak: int = 0
+    last_completed: Optional[str] = None
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    updated_at: str = Field(default_factory=utc_now_iso)
 
 class HabitCreate(BaseModel):
     name: str
@@ -68,6 +207,7 @@ class HabitLog(BaseModel):
     date: str
     completed: bool
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    updated_at: str = Field(default_factory=utc_now_iso)
 
 class HabitLogCreate(BaseModel):
     habit_id: str
@@ -83,6 +223,7 @@ class MoodLog(BaseModel):
     emoji: str
     note: Optional[str] = ""
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    updated_at: str = Field(default_factory=utc_now_iso)
 
 class MoodLogCreate(BaseModel):
     date: str
@@ -90,6 +231,21 @@ class MoodLogCreate(BaseModel):
     emoji: str
     note: Optional[str] = ""
 
+class HabitLogBatch(BaseModel):
+    logs: List[HabitLogCreate] = Field(max_length=BATCH_MAX_ENTRIES)
+
+class MoodLogBatch(BaseModel):
+    logs: List[MoodLogCreate] = Field(max_length=BATCH_MAX_ENTRIES)
+
+class DailyRollup(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    user_id: str
+    date: str
+    logged_habit_ids: List[str] = []
+    completed_habit_ids: List[str] = []
+    completion_count: int = 0
+    mood_level: Optional[int] = None
+
 class UserSettings(BaseModel):
     model_config = ConfigDict(extra="ignore")
     user_id: str
@@ -100,18 +256,878 @@ class SettingsUpdate(BaseModel):
     theme: Optional[str] = None
     color_palette: Optional[str] = None
 
+# ============ DB HELPERS ============
+
+# Keys the upserts rely on being unique; see dedupe_unique_keys
+UNIQUE_KEYS = [
+    (db.users, ("email",)),
+    (db.habit_logs, ("user_id", "habit_id", "date")),
+    (db.mood_logs, ("user_id", "date")),
+    (db.daily_rollups, ("user_id", "date")),
+    (db.data_versions, ("user_id",))
+]
+
+async def ensure_indexes():
+    # createIndex is a no-op for existing indexes; sending them all at once
+    # keeps startup to roughly one round trip
+    try:
+        await asyncio.gather(
+            *(collection.create_index([(field, 1) for field in fields], unique=True)
+              for collection, fields in UNIQUE_KEYS),
+            db.settings.create_index("user_id"),
+            db.habits.create_index("user_id"),
+            db.habit_logs.create_index([("user_id", 1), ("date", 1), ("id", 1)]),
+            *(collection.create_index([("user_id", 1), ("updated_at", 1)])
+              for collection in (db.habits, db.habit_logs, db.mood_logs)),
+            db.tombstones.create_index([("user_id", 1), ("deleted_at", 1)]),
+            db.tombstones.create_index("expire_at", expireAfterSeconds=0),
+            db.revoked_tokens.create_index("expires_at", expireAfterSeconds=0),
+            db.revoked_tokens.create_index("revoked_at")
+        )
+    except OperationFailure as e:
+        if e.code == 11000:
+            logger.error("Duplicate documents block a unique index; run `python dedupe_unique_keys.py` first")
+        raise
+    for cache in (insights_cache, user_cache):
+        if isinstance(cache, MongoCache):
+            await cache.ensure_indexes()
+
+async def dedupe_unique_keys(batch_size: int = 1000) -> dict:
+    # Deletes all but the newest document (latest updated_at, then latest
+    # _id) for every duplicated unique key, so the unique indexes can be
+    # built on data written before they existed. Deleted logs leave
+    # tombstones for sync clients, and the affected users' rollups and
+    # streaks are rebuilt. Returns the number deleted per collection.
+    removed = {}
+    affected_users = set()
+    for collection, fields in UNIQUE_KEYS:
+        pipeline = [
+            {"$sort": {"updated_at": -1, "_id": -1}},
+            {"$group": {
+                "_id": {field: f"${field}" for field in fields},
+                "docs": {"$push": {"_id": "$_id", "id": "$id", "user_id": "$user_id"}},
+                "count": {"$sum": 1}
+            }},
+            {"$match": {"count": {"$gt": 1}}}
+        ]
+        stale = []
+        async for group in collection.aggregate(pipeline, allowDiskUse=True):
+            kept = group["docs"][0].get("id")
+            # A copy sharing the kept document's id needs no tombstone
+            stale.extend({**doc, "id": None if doc.get("id") == kept else doc.get("id")}
+                         for doc in group["docs"][1:])
+        for start in range(0, len(stale), batch_size):
+            chunk = stale[start:start + batch_size]
+            await collection.delete_many({"_id": {"$in": [doc["_id"] for doc in chunk]}})
+            if collection.name in ("habit_logs", "mood_logs"):
+                for doc in chunk:
+                    if doc["id"]:
+                        await record_tombstone(doc["user_id"], collection.name, doc["id"])
+                    affected_users.add(doc["user_id"])
+        removed[collection.name] = len(stale)
+    for user_id in affected_users:
+        await rebuild_daily_rollups(user_id)
+        await verify_streaks(user_id, fix=True)
+        await bump_data_version(user_id)
+    return removed
+
+def require_day(value: str) -> str:
+    # Days are stored as dates, so writes cannot accept arbitrary strings.
+    # Returns the normalized day, which is what gets stored and echoed.
+    try:
+        return normalize_day(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+
+def upsert_filter(key: dict) -> tuple:
+    # (filter, fields to set) for an upsert key. A day in the key is matched
+    # in whichever form it is stored and always written back as a BSON date.
+    if "date" not in key:
+        return key, {}
+    return {**key, "date": date_storage.match_day(key["date"])}, {"date": to_db_day(key["date"])}
+
+async def upsert_one(collection, key: dict, fields: dict) -> tuple:
+    # Returns (previous, current) with dates as strings; previous is None
+    # when the document was inserted. `key` must be covered by a unique
+    # index. When two upserts race on a missing key the loser gets
+    # DuplicateKeyError; retrying once turns it into a plain update of the
+    # winner's document.
+    on_insert = {
+        "id": str(uuid.uuid4()),
+        "created_at": datetime.now(timezone.utc)
+    }
+    fields = {**fields, "updated_at": utc_now_iso()}
+    match, key_fields = upsert_filter(key)
+    update = {"$set": {**fields, **key_fields}, "$setOnInsert": on_insert}
+    try:
+        previous = await collection.find_one_and_update(
+            match, update, projection={"_id": 0}, upsert=True
+        )
+    except DuplicateKeyError:
+        previous = await collection.find_one_and_update(
+            match, update, projection={"_id": 0}, upsert=True
+        )
+    if previous:
+        decode_dates(previous)
+    current = decode_dates({**(previous or on_insert), **key, **fields})
+    return previous, current
+
+def encode_cursor(doc: dict) -> str:
+    raw = json.dumps([doc["date"], doc["id"]]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        date, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return date, doc_id
+
+async def find_page(collection, model, query: dict, response: Response, from_date: Optional[str],
+                    to_date: Optional[str], cursor: Optional[str], limit: int) -> list:
+    # Keyset pagination on (date, id): each page is an index range scan that
+    # starts where the previous one ended, so page cost does not grow with
+    # history length. The next cursor is returned in the X-Next-Cursor header.
+    after = decode_cursor(cursor) if cursor else None
+    
+    def page_query(day) -> dict:
+        page = dict(query)
+        date_range = {}
+        if from_date:
+            date_range["$gte"] = day(from_date)
+        if to_date:
+            date_range["$lte"] = day(to_date)
+        if date_range:
+            page["date"] = date_range
+        if after:
+            date, doc_id = after
+            page["$or"] = [{"date": {"$gt": day(date)}}, {"date": day(date), "id": {"$gt": doc_id}}]
+        return page
+    
+    try:
+        docs = await date_storage.find(collection, page_query, model_projection(model), [("date", 1), ("id", 1)], limit + 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    if len(docs) > limit:
+        docs = docs[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(docs[-1])
+    return docs
+
+def model_projection(model) -> dict:
+    return {"_id": 0, **{name: 1 for name in model.model_fields}}
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+    
+    def render(self, content) -> bytes:
+        with phase("render"):
+            return orjson.dumps(content)
+
+def list_response(docs: list, response: Response):
+    # Returning a Response object makes FastAPI skip response_model
+    # validation and serialization; the declared model still drives the
+    # OpenAPI schema. Only safe for documents read with model_projection,
+    # which already have the model's shape.
+    if not FAST_LIST_RESPONSES:
+        return docs
+    return FastJSONResponse(docs, headers=dict(response.headers))
+
+# ============ DELTA SYNC ============
+
+# Habits, habit logs and mood logs carry `updated_at`; deletions leave a
+# tombstone. A sync token is the server time the previous sync started, and
+# the next sync returns everything changed since then. Windows overlap by
+# SYNC_OVERLAP_SECONDS so writes that commit slightly out of order are not
+# missed; clients apply changes by id, so repeats are harmless. Tombstones
+# expire after SYNC_TOMBSTONE_RETENTION_DAYS, so older tokens get a full
+# snapshot instead.
+#
+# Responses are paged with keyset pagination on (updated_at, id), `limit`
+# documents per collection. While `more` is true the returned token is a
+# continuation token for the next page of the same sync; the last page
+# returns the token for the next sync.
+
+SYNC_COLLECTIONS = ("habits", "habit_logs", "mood_logs", "tombstones")
+
+async def record_tombstone(user_id: str, collection: str, doc_id: str):
+    now = datetime.now(timezone.utc)
+    await db.tombstones.insert_one({
+        "user_id": user_id,
+        "collection": collection,
+        "id": doc_id,
+        "deleted_at": utc_now_iso(),
+        "expire_at": now + timedelta(days=SYNC_TOMBSTONE_RETENTION_DAYS)
+    })
+
+def encode_sync_token(timestamp: str, since: Optional[str] = None, positions: Optional[dict] = None) -> str:
+    # `positions` maps each collection with more pages to the (updated_at,
+    # id) it stopped at; `since` is the start of the window being paged,
+    # None for a full snapshot
+    token = {"t": timestamp}
+    if positions is not None:
+        token.update({"s": since, "p": positions})
+    return base64.urlsafe_b64encode(json.dumps(token).encode('utf-8')).decode('ascii')
+
+def decode_sync_token(token: str) -> dict:
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        datetime.fromisoformat(decoded["t"])
+        if decoded.get("s") is not None:
+            datetime.fromisoformat(decoded["s"])
+        positions = decoded.get("p")
+        if positions is not None and (not set(positions) <= set(SYNC_COLLECTIONS)
+                                      or any(len(position) != 2 for position in positions.values())):
+            raise ValueError("Invalid positions")
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
+    return decoded
+
+def sync_after(field: str, position: list) -> dict:
+    # Documents sorting after `position` on (field, id). Documents written
+    # before `updated_at` existed have none and sort first.
+    value, doc_id = position
+    if value is None:
+        return {"$or": [{field: None, "id": {"$gt": doc_id}}, {field: {"$ne": None}}]}
+    return {"$or": [{field: {"$gt": value}}, {field: value, "id": {"$gt": doc_id}}]}
+
+# ============ DAILY ROLLUPS ============
+
+# One small document per user per day, kept in sync by every log write so
+# analytics read at most ~30 rollups instead of every raw log row. The
+# updates are aggregation pipelines so the set arithmetic and the count
+# happen atomically on the server.
+
+def _ids_or_empty(field: str) -> dict:
+    return {"$ifNull": [f"${field}", []]}
+
+def habit_log_rollup(user_id: str, date: str, habit_id: str, completed: bool) -> tuple:
+    # (filter, pipeline) applying one habit log to its day's rollup
+    habit = {"$literal": [habit_id]}
+    set_op = "$setUnion" if completed else "$setDifference"
+    return (
+        {"user_id": user_id, "date": date_storage.match_day(date)},
+        [
+            {"$set": {
+                "date": {"$literal": to_db_day(date)},
+                "logged_habit_ids": {"$setUnion": [_ids_or_empty("logged_habit_ids"), habit]},
+                "completed_habit_ids": {set_op: [_ids_or_empty("completed_habit_ids"), habit]},
+                "mood_level": {"$ifNull": ["$mood_level", None]}
+            }},
+            {"$set": {"completion_count": {"$size": "$completed_habit_ids"}}}
+        ]
+    )
+
+async def rollup_habit_log(user_id: str, date: str, habit_id: str, completed: bool):
+    await db.daily_rollups.update_one(*habit_log_rollup(user_id, date, habit_id, completed), upsert=True)
+
+async def rollup_mood_log(user_id: str, date: str, mood_level: Optional[int]):
+    await db.daily_rollups.update_one(
+        {"user_id": user_id, "date": date_storage.match_day(date)},
+        [{"$set": {
+            "date": {"$literal": to_db_day(date)},
+            "logged_habit_ids": _ids_or_empty("logged_habit_ids"),
+            "completed_habit_ids": _ids_or_empty("completed_habit_ids"),
+            "completion_count": {"$ifNull": ["$completion_count", 0]},
+            "mood_level": {"$literal": mood_level}
+        }}],
+        upsert=mood_level is not None
+    )
+
+async def rollup_remove_habit(user_id: str, habit_id: str):
+    habit = {"$literal": [habit_id]}
+    await db.daily_rollups.update_many(
+        {"user_id": user_id, "logged_habit_ids": habit_id},
+        [
+            {"$set": {
+                "logged_habit_ids": {"$setDifference": ["$logged_habit_ids", habit]},
+                "completed_habit_ids": {"$setDifference": ["$completed_habit_ids", habit]}
+            }},
+            {"$set": {"completion_count": {"$size": "$completed_habit_ids"}}}
+        ]
+    )
+
+async def rebuild_daily_rollups(user_id: Optional[str] = None, batch_size: int = 1000,
+                                dates: Optional[List[str]] = None) -> int:
+    # Recompute rollups from the raw log collections, optionally only for
+    # some dates. Grouping happens in MongoDB; results are streamed back and
+    # written in batches, so memory stays bounded regardless of history size.
+    match = {"user_id": user_id} if user_id else {}
+    if dates is not None:
+        match["date"] = date_storage.match_days(dates)
+    await db.daily_rollups.delete_many(match)
+    
+    habit_pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "date": date_storage.day_expression("$date")},
+            "logged_habit_ids": {"$addToSet": "$habit_id"},
+            "completed_habit_ids": {"$addToSet": {"$cond": ["$completed", "$habit_id", None]}}
+        }}
+    ]
+    written = 0
+    ops = []
+    async for row in db.habit_logs.aggregate(habit_pipeline):
+        completed_ids = [habit_id for habit_id in row["completed_habit_ids"] if habit_id is not None]
+        ops.append(UpdateOne(
+            {"user_id": row["_id"]["user_id"], "date": row["_id"]["date"]},
+            {"$set": {
+                "logged_habit_ids": row["logged_habit_ids"],
+                "completed_habit_ids": completed_ids,
+                "completion_count": len(completed_ids)
+            }, "$setOnInsert": {"mood_level": None}},
+            upsert=True
+        ))
+        if len(ops) >= batch_size:
+            written += len(ops)
+            await db.daily_rollups.bulk_write(ops, ordered=False)
+            ops = []
+    
+    async for log in db.mood_logs.find(match, {"_id": 0, "user_id": 1, "date": 1, "mood_level": 1}):
+        ops.append(UpdateOne(
+            {"user_id": log["user_id"], "date": stored_day(log["date"])},
+            {"$set": {"mood_level": log["mood_level"]}, "$setOnInsert": {
+                "logged_habit_ids": [],
+                "completed_habit_ids": [],
+                "completion_count": 0
+            }},
+            upsert=True
+        ))
+        if len(ops) >= batch_size:
+            written += len(ops)
+            await db.daily_rollups.bulk_write(ops, ordered=False)
+            ops = []
+    
+    if ops:
+        written += len(ops)
+        await db.daily_rollups.bulk_write(ops, ordered=False)
+    return written
+
+async def get_recent_rollups(user_id: str, since: str) -> List[dict]:
+    return await date_storage.find(
+        db.daily_rollups, lambda day: {"user_id": user_id, "date": {"$gte": day(since)}}, {"_id": 0}, [("date", 1)], 1000
+    )
+
+# ============ STREAKS ============
+
+# Each habit stores the run ending at its most recent completed day
+# (current_streak), its longest run and that day (last_completed). A toggle
+# only walks the run it touches; the full history is read again only when a
+# day is removed from the longest run, since the next-longest could be
+# anywhere.
+
+def parse_day(value: str):
+    return datetime.fromisoformat(value).date()
+
+def compute_streaks(dates: List[str]) -> dict:
+    # `dates` are the completed days in ascending order
+    longest = run = 0
+    previous = None
+    for value in dates:
+        day = parse_day(value)
+        run = run + 1 if previous and day - previous == timedelta(days=1) else 1
+        longest = max(longest, run)
+        previous = day
+    return {
+        "current_streak": run,
+        "longest_streak": longest,
+        "last_completed": dates[-1] if dates else None
+    }
+
+def effective_current_streak(habit: dict) -> int:
+    # The stored run only counts as current while its last day is today or
+    # yesterday
+    last = habit.get("last_completed")
+    if not last:
+        return 0
+    yesterday = datetime.now(timezone.utc).date() - timedelta(days=1)
+    return habit.get("current_streak", 0) if parse_day(last) >= yesterday else 0
+
+async def count_run(user_id: str, habit_id: str, start, step: int) -> int:
+    # Length of the run of completed days beginning at `start` and walking
+    # one day at a time in direction `step`; stops at the first gap
+    op, order = ("$gte", 1) if step > 0 else ("$lte", -1)
+    cursor = date_storage.stream(
+        db.habit_logs,
+        lambda day: {"user_id": user_id, "habit_id": habit_id, "completed": True, "date": {op: day(start.isoformat())}},
+        {"_id": 0, "date": 1}, [("date", order)]
+    )
+    expected = start
+    length = 0
+    async for log in cursor:
+        if log["date"] != expected.isoformat():
+            break
+        length += 1
+        expected += timedelta(days=step)
+    return length
+
+async def recompute_streaks(user_id: str, habit_id: str) -> dict:
+    logs = await date_storage.find(
+        db.habit_logs, lambda day: {"user_id": user_id, "habit_id": habit_id, "completed": True},
+        {"_id": 0, "date": 1}, [("date", 1)]
+    )
+    return compute_streaks([log["date"] for log in logs])
+
+async def update_streaks(user_id: str, habit_id: str, date: str, completed: bool):
+    habit = await db.habits.find_one({"id": habit_id, "user_id": user_id}, {"_id": 0})
+    if not habit:
+        return
+    try:
+        day = parse_day(date)
+    except ValueError:
+        return
+    
+    current = habit.get("current_streak", 0)
+    longest = habit.get("longest_streak", 0)
+    last = parse_day(habit["last_completed"]) if habit.get("last_completed") else None
+    one_day = timedelta(days=1)
+    before = await count_run(user_id, habit_id, day - one_day, -1)
+    after = await count_run(user_id, habit_id, day + one_day, 1)
+    
+    if completed:
+        run = before + 1 + after
+        longest = max(longest, run)
+        if last is None or day > last:
+            last, current = day, run
+        elif day + one_day * after == last:
+            current = run
+        stats = {"current_streak": current, "longest_streak": longest, "last_completed": last.isoformat()}
+    elif before + 1 + after == longest:
+        stats = await recompute_streaks(user_id, habit_id)
+    elif day == last:
+        if before:
+            stats = {"current_streak": before, "last_completed": (day - one_day).isoformat()}
+        else:
+            earlier = await date_storage.find(
+                db.habit_logs,
+                lambda day: {"user_id": user_id, "habit_id": habit_id, "completed": True, "date": {"$lt": day(date)}},
+                {"_id": 0, "date": 1}, [("date", -1)], 1
+            )
+            previous = earlier[0] if earlier else None
+            if previous:
+                previous_day = parse_day(previous["date"])
+                run = await count_run(user_id, habit_id, previous_day, -1)
+                stats = {"current_streak": run, "last_completed": previous["date"]}
+            else:
+                stats = {"current_streak": 0, "last_completed": None}
+    elif last and day + one_day * after == last:
+        stats = {"current_streak": after}
+    else:
+        return
+    await db.habits.update_one({"id": habit_id, "user_id": user_id}, {"$set": {**stats, "updated_at": utc_now_iso()}})
+    await habits_cache.invalidate(user_id)
+
+async def verify_streaks(user_id: Optional[str] = None, fix: bool = False) -> List[dict]:
+    # Compare stored streaks against a full recomputation from habit_logs
+    mismatches = []
+    query = {"user_id": user_id} if user_id else {}
+    fields = ("current_streak", "longest_streak", "last_completed")
+    async for habit in db.habits.find(query, {"_id": 0}):
+        expected = await recompute_streaks(habit["user_id"], habit["id"])
+        stored = {field: habit.get(field, Habit.model_fields[field].default) for field in fields}
+        if stored != expected:
+            mismatches.append({"habit_id": habit["id"], "stored": stored, "expected": expected})
+            if fix:
+                await db.habits.update_one({"id": habit["id"]}, {"$set": {**expected, "updated_at": utc_now_iso()}})
+                await habits_cache.invalidate(habit["user_id"])
+                await bump_data_version(habit["user_id"])
+    return mismatches
+
+# ============ BATCH WRITES ============
+
+# Bulk upserts for imports and offline clients. Habit ownership is checked
+# once per batch, the entries go to MongoDB as one unordered bulk_write and
+# every entry gets its own result. Rollups and streaks for the touched days
+# and habits are rebuilt once per batch instead of once per entry.
+
+async def bulk_upsert(collection, entries: List[tuple]) -> List[dict]:
+    # `entries` are (key, fields) pairs with distinct keys covered by a
+    # unique index, optionally followed by fields to set only on insert.
+    # Keys that lose an insert race to a concurrent upsert are retried once,
+    # as in upsert_one.
+    results = [None] * len(entries)
+    pending = list(range(len(entries)))
+    for attempt in range(2 if entries else 0):
+        now = datetime.now(timezone.utc)
+        ops = []
+        for i in pending:
+            match, key_fields = upsert_filter(entries[i][0])
+            ops.append(UpdateOne(match, {
+                "$set": {**entries[i][1], **key_fields, "updated_at": now.isoformat(timespec="microseconds")},
+                "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now, **(entries[i][2] if len(entries[i]) > 2 else {})}
+            }, upsert=True))
+        try:
+            upserted = (await collection.bulk_write(ops, ordered=False)).upserted_ids
+            errors = []
+        except BulkWriteError as e:
+            upserted = {item["index"]: item["_id"] for item in e.details.get("upserted", [])}
+            errors = e.details.get("writeErrors", [])
+        for position, i in enumerate(pending):
+            results[i] = {"status": "created" if position in upserted else "updated"}
+        retry = []
+        for error in errors:
+            i = pending[error["index"]]
+            if error.get("code") == 11000 and attempt == 0:
+                retry.append(i)
+            else:
+                results[i] = {"status": "error", "error": error.get("errmsg", "Write failed")}
+        pending = retry
+        if not pending:
+            break
+    return results
+
+def check_batch_dates(entries: list, results: list, key) -> dict:
+    # Maps each distinct key to the index of its last valid entry; earlier
+    # entries for the same key are marked superseded (last one wins)
+    latest = {}
+    for i, entry in enumerate(entries):
+        if results[i] is not None:
+            continue
+        try:
+            entry.date = normalize_day(entry.date)
+        except ValueError:
+            results[i] = {"status": "error", "error": "Invalid date"}
+            continue
+        if key(entry) in latest:
+            results[latest[key(entry)]] = {"status": "superseded"}
+        latest[key(entry)] = i
+    return latest
+
+async def apply_habit_log_batch(user_id: str, entries: List[HabitLogCreate]) -> List[dict]:
+    # Pending buffered logs are older than this batch, so they go first
+    await habit_log_writes.flush(user_id)
+    results = [None] * len(entries)
+    habit_ids = list({entry.habit_id for entry in entries})
+    owned = set(await db.habits.distinct("id", {"user_id": user_id, "id": {"$in": habit_ids}}))
+    for i, entry in enumerate(entries):
+        if entry.habit_id not in owned:
+            results[i] = {"status": "error", "error": "Habit not found"}
+    
+    latest = check_batch_dates(entries, results, lambda entry: (entry.habit_id, entry.date))
+    indexes = list(latest.values())
+    written = await bulk_upsert(db.habit_logs, [
+        ({"user_id": user_id, "habit_id": entries[i].habit_id, "date": entries[i].date},
+         {"completed": entries[i].completed})
+        for i in indexes
+    ])
+    applied = []
+    for i, result in zip(indexes, written):
+        results[i] = result
+        if result["status"] != "error":
+            applied.append(entries[i])
+    
+    if applied:
+        await refresh_habit_log_aggregates(
+            user_id, {entry.date for entry in applied}, {entry.habit_id for entry in applied}
+        )
+    return results
+
+async def refresh_habit_log_aggregates(user_id: str, dates: set, habit_ids: set):
+    # Rebuild what depends on the logs of these days and habits after a bulk write
+    await rebuild_daily_rollups(user_id, dates=sorted(dates))
+    for habit_id in habit_ids:
+        stats = await recompute_streaks(user_id, habit_id)
+        await db.habits.update_one({"id": habit_id, "user_id": user_id}, {"$set": {**stats, "updated_at": utc_now_iso()}})
+    await habits_cache.invalidate(user_id)
+    await bump_data_version(user_id)
+
+async def write_buffered_habit_logs(logs: List[dict]):
+    # Flush callback of habit_log_writes: one bulk_write for every user's
+    # pending logs and one for their rollups. Logs keep the id and created_at
+    # they were returned with when they create the document. Each log
+    # carries the `stored_completed` state read when it was buffered, so
+    # streaks are only touched where completion actually changed.
+    written = await bulk_upsert(db.habit_logs, [
+        ({"user_id": log["user_id"], "habit_id": log["habit_id"], "date": log["date"]},
+         {"completed": log["completed"]},
+         {"id": log["id"], "created_at": to_db_time(log["created_at"])})
+        for log in logs
+    ])
+    applied = []
+    for log, result in zip(logs, written):
+        if result["status"] == "error":
+            logger.error(f"Buffered habit log write failed: {result['error']}")
+        else:
+            applied.append(log)
+    if not applied:
+        return
+    
+    ops = [UpdateOne(*habit_log_rollup(log["user_id"], log["date"], log["habit_id"], log["completed"]), upsert=True)
+           for log in applied]
+    try:
+        await db.daily_rollups.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        # A day's rollup inserted concurrently by another worker; the
+        # pipelines are idempotent, so the losers are simply applied again
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != 11000 for error in errors):
+            raise
+        await db.daily_rollups.bulk_write([ops[error["index"]] for error in errors], ordered=False)
+    
+    changed = {}
+    for log in applied:
+        if log["completed"] != log["stored_completed"]:
+            changed.setdefault((log["user_id"], log["habit_id"]), []).append(log)
+    for (user_id, habit_id), habit_logs in changed.items():
+        if len(habit_logs) == 1:
+            await update_streaks(user_id, habit_id, habit_logs[0]["date"], habit_logs[0]["completed"])
+        else:
+            # update_streaks assumes one changed day; several are rare
+            # enough per flush to recompute from the logs
+            stats = await recompute_streaks(user_id, habit_id)
+            await db.habits.update_one({"id": habit_id, "user_id": user_id}, {"$set": {**stats, "updated_at": utc_now_iso()}})
+    for user_id in {log["user_id"] for log in applied}:
+        await habits_cache.invalidate(user_id)
+        await bump_data_version(user_id)
+
+async def apply_mood_log_batch(user_id: str, entries: List[MoodLogCreate]) -> List[dict]:
+    results = [None] * len(entries)
+    latest = check_batch_dates(entries, results, lambda entry: entry.date)
+    indexes = list(latest.values())
+    written = await bulk_upsert(db.mood_logs, [
+        ({"user_id": user_id, "date": entries[i].date},
+         {"mood_level": entries[i].mood_level, "emoji": entries[i].emoji, "note": entries[i].note})
+        for i in indexes
+    ])
+    applied = []
+    for i, result in zip(indexes, written):
+        results[i] = result
+        if result["status"] != "error":
+            applied.append(entries[i])
+    
+    if applied:
+        await rebuild_daily_rollups(user_id, dates=sorted({entry.date for entry in applied}))
+        await bump_data_version(user_id)
+    return results
+
+def batch_response(results: List[dict]) -> dict:
+    counts = Counter(result["status"] for result in results)
+    return {
+        "created": counts["created"],
+        "updated": counts["updated"],
+        "superseded": counts["superseded"],
+        "failed": counts["error"],
+        "results": [{"index": i, **result} for i, result in enumerate(results)]
+    }
+
+async def import_records(request: Request, format: str, model, apply_batch) -> dict:
+    # Parse the upload line by line and apply it IMPORT_BATCH_SIZE entries at
+    # a time, so memory use does not depend on the file size
+    counts = Counter()
+    errors = []
+    lines, entries = [], []
+    
+    def fail(line: int, message: str):
+        # Errors from a batch arrive after parse errors on later lines, so
+        # keep the first IMPORT_MAX_ERRORS by line rather than by arrival
+        counts["error"] += 1
+        errors.append({"line": line, "error": message})
+        if len(errors) > IMPORT_MAX_ERRORS:
+            errors.sort(key=lambda error: error["line"])
+            errors.pop()
+    
+    async def flush():
+        for line, result in zip(lines, await apply_batch(entries)):
+            if result["status"] == "error":
+                fail(line, result["error"])
+            else:
+                counts[result["status"]] += 1
+        lines.clear()
+        entries.clear()
+    
+    async for line, fields, error in iter_records(request.stream(), format):
+        counts["lines"] += 1
+        if error:
+            fail(line, error)
+            continue
+        try:
+            entries.append(model.model_validate(fields))
+        except ValidationError as e:
+            first = e.errors()[0]
+            fail(line, f"{'.'.join(str(part) for part in first['loc'])}: {first['msg']}")
+            continue
+        lines.append(line)
+        if len(entries) >= IMPORT_BATCH_SIZE:
+            await flush()
+    if entries:
+        await flush()
+    
+    return {
+        "lines": counts["lines"],
+        "created": counts["created"],
+        "updated": counts["updated"],
+        "superseded": counts["superseded"],
+        "failed": counts["error"],
+        "errors": sorted(errors, key=lambda error: error["line"])
+    }
+
+# ============ EXPORT ============
+
+async def export_records(user_id: Optional[str] = None):
+    # Streams (record_type, document) pairs straight off the cursors; with no
+    # user_id every user's data is exported
+    query = {"user_id": user_id} if user_id else {}
+    async for settings in db.settings.find(query, {"_id": 0}):
+        yield "settings", settings
+    async for habit in date_storage.stream(db.habits, lambda day: query, {"_id": 0}, [("created_at", 1)]):
+        # The streak as the API reports it, not the stored run
+        yield "habit", {**habit, "current_streak": effective_current_streak(habit)}
+    async for log in date_storage.stream(db.habit_logs, lambda day: query, {"_id": 0}, [("date", 1), ("id", 1)]):
+        yield "habit_log", log
+    async for log in date_storage.stream(db.mood_logs, lambda day: query, {"_id": 0}, [("date", 1)]):
+        yield "mood_log", log
+
+# ============ HEATMAP HELPERS ============
+
+def parse_day_range(from_date: Optional[str], to_date: Optional[str], default_days: int = HEATMAP_DEFAULT_DAYS) -> tuple:
+    try:
+        end = to_db_day(to_date).date() if to_date else datetime.now(timezone.utc).date()
+        start = to_db_day(from_date).date() if from_date else end - timedelta(days=default_days - 1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+    days = (end - start).days + 1
+    if days < 1 or days > HEATMAP_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must cover 1 to {HEATMAP_MAX_DAYS} days")
+    return start, end, days
+
+def pack_days(dates, start, days: int) -> str:
+    # Bit i (LSB-first within each byte) is set when day start + i is
+    # completed; a full year fits in 46 bytes before base64
+    bits = bytearray((days + 7) // 8)
+    for date in dates:
+        index = (datetime.fromisoformat(date).date() - start).days
+        if 0 <= index < days:
+            bits[index >> 3] |= 1 << (index & 7)
+    return base64.b64encode(bytes(bits)).decode('ascii')
+
+# ============ AI INSIGHTS ============
+
+INSIGHTS_NOT_ENOUGH_DATA = "Not enough data yet. Start tracking your habits and mood to get AI insights!"
+INSIGHTS_UNAVAILABLE = "Unable to generate AI insights at this time. Please try again later."
+INSIGHTS_SYSTEM_MESSAGE = "You are a supportive wellness coach providing personalized habit insights."
+
+async def load_insights_inputs(user_id: str) -> Optional[dict]:
+    # Get data for the last 30 days
+    today = datetime.now(timezone.utc).date()
+    thirty_days_ago = today - timedelta(days=30)
+    
+    habits = await db.habits.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
+    rollups = await get_recent_rollups(user_id, thirty_days_ago.isoformat())
+    mood_by_date = {day["date"]: day["mood_level"] for day in rollups if day.get("mood_level") is not None}
+    
+    if not habits or not mood_by_date:
+        return None
+    
+    correlations = habit_mood_correlations(rollups, habits, thirty_days_ago, today)
+    return {
+        "habit_names": [h["name"] for h in habits],
+        "mood_by_date": mood_by_date,
+        "total_completions": sum(day["completion_count"] for day in rollups),
+        "habit_stats": correlations["habits"]
+    }
+
+def insights_fingerprint(inputs: dict) -> str:
+    canonical = json.dumps([INSIGHTS_PROMPT_VERSION, inputs], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def build_insights_prompt(inputs: dict) -> str:
+    habit_names = inputs["habit_names"]
+    mood_by_date = inputs["mood_by_date"]
+    
+    # Create prompt for GPT-5
+    prompt = f"""
+You are a wellness coach analyzing a user's habit and mood data.
+
+User's Habits: {', '.join(habit_names)}
+
+Last 30 days data:
+- Total mood entries: {len(mood_by_date)}
+- Average mood level: {sum(mood_by_date.values()) / len(mood_by_date):.1f}/5
+- Total habit completions: {inputs["total_completions"]}
+
+Habit and mood statistics (mood on a 1-5 scale, r = correlation between completing the habit and mood):
+"""
+    
+    for stats in inputs["habit_stats"]:
+        line = f"\n- {stats['name']}: completed on {stats['days_completed']} days"
+        if stats["mood_lift"] is not None:
+            line += f"; mood {stats['mood_lift']:+.2f} on days completed (r={stats['correlation'] if stats['correlation'] is not None else 'n/a'})"
+        if stats["next_day_lift"] is not None:
+            line += f"; next-day mood {stats['next_day_lift']:+.2f}"
+        prompt += line
+    
+    prompt += "\n\nProvide 3-4 brief, actionable insights about:\n1. Which habits seem to correlate with better mood\n2. Consistency patterns\n3. Recommendations for improvement\n\nKeep it warm, encouraging, and under 200 words."
+    return prompt
+
+async def generate_insights(user_id: str, prompt: str) -> str:
+    with observe(LLM_LATENCY, LLM_ERRORS, operation="complete"):
+        return await llm_client.complete(f"insights_{user_id}", INSIGHTS_SYSTEM_MESSAGE, prompt)
+
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def insights_result(insights: str, cached: bool = False, cache_age_seconds: Optional[float] = None) -> dict:
+    return {"insights": insights, "cached": cached, "cache_age_seconds": cache_age_seconds}
+
+async def submit_insights(user_id: str):
+    # Returns (result, None) when the answer is already known, otherwise
+    # (None, job) for an LLM call queued on the bounded worker pool.
+    # Identical inputs share one pending job.
+    inputs = await load_insights_inputs(user_id)
+    if inputs is None:
+        return insights_result(INSIGHTS_NOT_ENOUGH_DATA), None
+    
+    key = insights_fingerprint(inputs)
+    entry = await insights_cache.get(key)
+    if entry is not None:
+        return insights_result(entry.value, True, round(entry.age_seconds)), None
+    
+    async def run():
+        response = await generate_insights(user_id, build_insights_prompt(inputs))
+        await insights_cache.set(key, response)
+        return insights_result(response, False, 0)
+    
+    return None, insight_jobs.submit(key, user_id, run)
+
 # ============ AUTH HELPERS ============
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+# bcrypt is deliberately slow (~100-300 ms per call) and releases the GIL
+# while hashing, so it runs on a small dedicated thread pool instead of
+# blocking the event loop. Once BCRYPT_MAX_PENDING calls are running or
+# queued, new ones are rejected with 503 rather than piling up.
+
+async def run_bcrypt(func, *args):
+    if bcrypt_slots.locked():
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+    async with bcrypt_slots:
+        return await asyncio.get_running_loop().run_in_executor(bcrypt_executor, func, *args)
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+def _hash_password(password: str) -> str:
+    with observe(BCRYPT_SECONDS, operation="hash"):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(BCRYPT_ROUNDS)).decode('utf-8')
+
+def _verify_password(password: str, hashed: str) -> bool:
+    with observe(BCRYPT_SECONDS, operation="verify"):
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+async def hash_password(password: str) -> str:
+    return await run_bcrypt(_hash_password, password)
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await run_bcrypt(_verify_password, password, hashed)
+
+def needs_rehash(hashed: str) -> bool:
+    # bcrypt hashes look like $2b$<cost>$<salt+digest>
+    try:
+        return int(hashed.split('$')[2]) < BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
 
 def create_jwt_token(user_id: str) -> str:
     expiration = datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
     payload = {
         "user_id": user_id,
+        "iat": time.time(),
         "exp": expiration
     }
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
@@ -124,25 +1140,175 @@ def decode_jwt_token(token: str) -> dict:
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def token_issued_at(payload: dict) -> float:
+    # Tokens issued before `iat` was added are dated from their expiry
+    return payload.get("iat", payload["exp"] - JWT_EXPIRATION_HOURS * 3600)
+
+async def verify_token(token: str) -> dict:
+    # Verified claims are cached by token digest until the token expires, so
+    # the signature is only checked on the first request with a token
+    with phase("auth"):
+        digest = token_digest(token)
+        entry = await token_cache.get(digest)
+        if entry is None:
+            payload = decode_jwt_token(token)
+            await token_cache.set(digest, payload, ttl_seconds=payload["exp"] - time.time())
+        else:
+            payload = entry.value
+        if revocations.is_revoked(digest, payload):
+            raise HTTPException(status_code=401, detail="Token revoked")
+        return payload
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
-    payload = decode_jwt_token(credentials.credentials)
+    payload = await verify_token(credentials.credentials)
     return payload["user_id"]
 
+# ============ CONDITIONAL GETS ============
+
+# Every mutating route bumps a per-user version counter after its write.
+# Read routes tag responses with it (plus the UTC day, since streaks and
+# rolling windows change at midnight without any write) and answer 304
+# before touching any data collection when the client's tag is current.
+
+async def bump_data_version(user_id: str):
+    await db.data_versions.update_one({"user_id": user_id}, {"$inc": {"version": 1}}, upsert=True)
+
+async def data_version(user_id: str) -> int:
+    doc = await db.data_versions.find_one({"user_id": user_id}, {"_id": 0, "version": 1})
+    return doc["version"] if doc else 0
+
+def data_etag(version: int) -> str:
+    return f'W/"{version}-{datetime.now(timezone.utc).date().isoformat()}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+async def get_current_user_flushed(user_id: str = Depends(get_current_user)) -> str:
+    # For routes that read habit logs or anything derived from them, so the
+    # user sees their own buffered writes (and the version they bump)
+    await habit_log_writes.flush(user_id)
+    return user_id
+
+async def get_current_user_if_modified(
+    request: Request,
+    response: Response,
+    user_id: str = Depends(get_current_user_flushed)
+) -> str:
+    # Kept for the user caches, which check entries against it
+    request.state.data_version = await data_version(user_id)
+    etag = data_etag(request.state.data_version)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        raise HTTPException(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return user_id
+
+# ============ USER CACHE ============
+
+async def list_habits(user_id: str, version: int) -> List[dict]:
+    habits = await habits_cache.get(user_id, lambda: load_habits(user_id), version)
+    # Cached documents are shared, so streaks are filled in on copies
+    return [{**habit, "current_streak": effective_current_streak(habit)} for habit in habits]
+
+async def load_habits(user_id: str) -> List[dict]:
+    return [decode_dates(habit) for habit in await db.habits.find({"user_id": user_id}, {"_id": 0}).to_list(1000)]
+
+async def load_settings(user_id: str) -> dict:
+    settings = await db.settings.find_one({"user_id": user_id}, {"_id": 0})
+    if not settings:
+        # Create default settings
+        settings = UserSettings(user_id=user_id).model_dump()
+        await db.settings.insert_one({**settings})
+    return settings
+
+# ============ TOKEN REVOCATION ============
+
+class RevocationList:
+    # Revocations live in the revoked_tokens collection (TTL-expired once the
+    # tokens they cover could no longer be valid anyway). Each worker keeps a
+    # local copy that is updated immediately for its own writes and pulled
+    # incrementally every REVOCATION_REFRESH_SECONDS for everyone else's, so
+    # the per-request check is two dict lookups.
+    def __init__(self):
+        self.tokens = {}        # token digest -> exp timestamp
+        self.sessions = {}      # user_id -> revoked_at; tokens issued before are invalid
+        self.synced_at = 0.0
+    
+    def is_revoked(self, digest: str, payload: dict) -> bool:
+        if digest in self.tokens:
+            return True
+        revoked_at = self.sessions.get(payload["user_id"])
+        return revoked_at is not None and token_issued_at(payload) <= revoked_at
+    
+    def _apply(self, doc: dict):
+        if doc.get("token_digest"):
+            self.tokens[doc["token_digest"]] = doc["expires_at"].replace(tzinfo=timezone.utc).timestamp()
+        else:
+            self.sessions[doc["user_id"]] = max(self.sessions.get(doc["user_id"], 0), doc["revoked_at"])
+    
+    async def revoke_token(self, digest: str, payload: dict):
+        doc = {
+            "token_digest": digest,
+            "user_id": payload["user_id"],
+            "revoked_at": time.time(),
+            "expires_at": datetime.fromtimestamp(payload["exp"], timezone.utc)
+        }
+        await db.revoked_tokens.insert_one(doc)
+        self._apply(doc)
+    
+    async def revoke_sessions(self, user_id: str):
+        doc = {
+            "token_digest": None,
+            "user_id": user_id,
+            "revoked_at": time.time(),
+            "expires_at": datetime.now(timezone.utc) + timedelta(hours=JWT_EXPIRATION_HOURS)
+        }
+        await db.revoked_tokens.insert_one(doc)
+        self._apply(doc)
+    
+    async def refresh(self):
+        # Overlap the window a little so writes that commit out of order
+        # between two refreshes are not missed
+        started = time.time()
+        query = {"revoked_at": {"$gte": self.synced_at - 5}} if self.synced_at else {}
+        async for doc in db.revoked_tokens.find(query, {"_id": 0}):
+            self._apply(doc)
+        self.synced_at = started
+        
+        now = time.time()
+        self.tokens = {digest: exp for digest, exp in self.tokens.items() if exp > now}
+        horizon = now - JWT_EXPIRATION_HOURS * 3600
+        self.sessions = {user_id: at for user_id, at in self.sessions.items() if at > horizon}
+    
+    async def run(self):
+        while True:
+            await asyncio.sleep(REVOCATION_REFRESH_SECONDS)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logging.error(f"Revocation refresh error: {str(e)}")
+
+revocations = RevocationList()
+
 # ============ AUTH ROUTES ============
 
 @api_router.post("/auth/register")
 async def register(user_data: UserRegister):
-    # Check if user exists
-    existing = await db.users.find_one({"email": user_data.email}, {"_id": 0})
-    if existing:
-        raise HTTPException(status_code=400, detail="Email already registered")
-    
-    # Create user
+    # Create user; the unique email index rejects duplicates atomically
     user = User(
         email=user_data.email,
-        password_hash=hash_password(user_data.password)
+        password_hash=await hash_password(user_data.password)
     )
-    await db.users.insert_one(user.model_dump())
+    try:
+        await db.users.insert_one({**user.model_dump(), "created_at": to_db_time(user.created_at)})
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create default settings
     settings = UserSettings(user_id=user.id)
@@ -151,21 +1317,44 @@ async def register(user_data: UserRegister):
     token = create_jwt_token(user.id)
     return {"token": token, "user_id": user.id, "email": user.email}
 
+@api_router.post("/auth/logout")
+async def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    payload = await verify_token(credentials.credentials)
+    digest = token_digest(credentials.credentials)
+    await revocations.revoke_token(digest, payload)
+    await token_cache.delete(digest)
+    return {"success": True}
+
+@api_router.post("/auth/logout-all")
+async def logout_all(user_id: str = Depends(get_current_user)):
+    await revocations.revoke_sessions(user_id)
+    return {"success": True}
+
 @api_router.post("/auth/login")
 async def login(credentials: UserLogin):
     user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user or not verify_password(credentials.password, user["password_hash"]):
+    if not user or not await verify_password(credentials.password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    # Upgrade hashes made at an older work factor while we have the password
+    if needs_rehash(user["password_hash"]):
+        try:
+            new_hash = await hash_password(credentials.password)
+            await db.users.update_one(
+                {"id": user["id"], "password_hash": user["password_hash"]},
+                {"$set": {"password_hash": new_hash}}
+            )
+        except HTTPException:
+            pass
+    
     token = create_jwt_token(user["id"])
     return {"token": token, "user_id": user["id"], "email": user["email"]}
 
 # ============ HABITS ROUTES ============
 
 @api_router.get("/habits", response_model=List[Habit])
-async def get_habits(user_id: str = Depends(get_current_user)):
-    habits = await db.habits.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    return habits
+async def get_habits(request: Request, user_id: str = Depends(get_current_user_if_modified)):
+    return await list_habits(user_id, request.state.data_version)
 
 @api_router.post("/habits", response_model=Habit)
 async def create_habit(habit_data: HabitCreate, user_id: str = Depends(get_current_user)):
@@ -174,149 +1363,387 @@ async def create_habit(habit_data: HabitCreate, user_id: str = Depends(get_curre
         name=habit_data.name,
         color=habit_data.color
     )
-    await db.habits.insert_one(habit.model_dump())
+    await db.habits.insert_one({**habit.model_dump(), "created_at": to_db_time(habit.created_at)})
+    await habits_cache.invalidate(user_id)
+    await bump_data_version(user_id)
     return habit
 
+@api_router.get("/habits/heatmaps")
+async def get_habit_heatmaps(
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    user_id: str = Depends(get_current_user_if_modified)
+):
+    start, end, days = parse_day_range(from_date, to_date)
+    habits = await db.habits.find({"user_id": user_id}, {"_id": 0, "id": 1}).to_list(1000)
+    rollups = await date_storage.find(
+        db.daily_rollups,
+        lambda day: {"user_id": user_id, "date": {"$gte": day(start.isoformat()), "$lte": day(end.isoformat())},
+                     "completion_count": {"$gt": 0}},
+        {"_id": 0, "date": 1, "completed_habit_ids": 1}, [("date", 1)], days
+    )
+    
+    completed_dates = {habit["id"]: [] for habit in habits}
+    for day in rollups:
+        for habit_id in day["completed_habit_ids"]:
+            if habit_id in completed_dates:
+                completed_dates[habit_id].append(day["date"])
+    
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "days": days,
+        "heatmaps": {habit_id: pack_days(dates, start, days) for habit_id, dates in completed_dates.items()}
+    }
+
+@api_router.get("/habits/{habit_id}/heatmap")
+async def get_habit_heatmap(
+    habit_id: str,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    user_id: str = Depends(get_current_user_if_modified)
+):
+    start, end, days = parse_day_range(from_date, to_date)
+    habit = await db.habits.find_one({"id": habit_id, "user_id": user_id}, {"_id": 0, "id": 1})
+    if not habit:
+        raise HTTPException(status_code=404, detail="Habit not found")
+    rollups = await date_storage.find(
+        db.daily_rollups,
+        lambda day: {"user_id": user_id, "date": {"$gte": day(start.isoformat()), "$lte": day(end.isoformat())},
+                     "completed_habit_ids": habit_id},
+        {"_id": 0, "date": 1}, [("date", 1)], days
+    )
+    
+    return {
+        "habit_id": habit_id,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "days": days,
+        "bits": pack_days([day["date"] for day in rollups], start, days)
+    }
+
 @api_router.put("/habits/{habit_id}", response_model=Habit)
 async def update_habit(habit_id: str, habit_data: HabitCreate, user_id: str = Depends(get_current_user)):
     result = await db.habits.find_one_and_update(
         {"id": habit_id, "user_id": user_id},
-        {"$set": {"name": habit_data.name, "color": habit_data.color}},
+        {"$set": {"name": habit_data.name, "color": habit_data.color, "updated_at": utc_now_iso()}},
         return_document=True
     )
     if not result:
         raise HTTPException(status_code=404, detail="Habit not found")
+    await habits_cache.invalidate(user_id)
+    await bump_data_version(user_id)
     result.pop("_id", None)
-    return result
+    return decode_dates(result)
 
 @api_router.delete("/habits/{habit_id}")
-async def delete_habit(habit_id: str, user_id: str = Depends(get_current_user)):
+async def delete_habit(habit_id: str, user_id: str = Depends(get_current_user_flushed)):
     result = await db.habits.delete_one({"id": habit_id, "user_id": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Habit not found")
-    # Also delete all logs for this habit
+    await habits_cache.invalidate(user_id)
+    # Also delete all logs for this habit; the habit's tombstone covers them
+    await record_tombstone(user_id, "habits", habit_id)
     await db.habit_logs.delete_many({"habit_id": habit_id, "user_id": user_id})
+    await rollup_remove_habit(user_id, habit_id)
+    await bump_data_version(user_id)
     return {"success": True}
 
 # ============ HABIT LOGS ROUTES ============
 
 @api_router.get("/habit-logs", response_model=List[HabitLog])
-async def get_habit_logs(user_id: str = Depends(get_current_user)):
-    logs = await db.habit_logs.find({"user_id": user_id}, {"_id": 0}).to_list(10000)
-    return logs
+async def get_habit_logs(
+    response: Response,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    habit_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user_id: str = Depends(get_current_user_if_modified)
+):
+    query = {"user_id": user_id}
+    if habit_id:
+        query["habit_id"] = habit_id
+    logs = await find_page(db.habit_logs, HabitLog, query, response, from_date, to_date, cursor, limit)
+    return list_response(logs, response)
 
 @api_router.post("/habit-logs", response_model=HabitLog)
 async def create_habit_log(log_data: HabitLogCreate, user_id: str = Depends(get_current_user)):
-    # Check if log already exists for this date and habit
-    existing = await db.habit_logs.find_one({
-        "user_id": user_id,
-        "habit_id": log_data.habit_id,
-        "date": log_data.date
-    }, {"_id": 0})
-    
-    if existing:
-        # Update existing log
-        await db.habit_logs.update_one(
-            {"id": existing["id"]},
-            {"$set": {"completed": log_data.completed}}
-        )
-        existing["completed"] = log_data.completed
-        return HabitLog(**existing)
-    
-    # Create new log
-    log = HabitLog(
-        user_id=user_id,
-        habit_id=log_data.habit_id,
-        date=log_data.date,
-        completed=log_data.completed
+    log_data.date = require_day(log_data.date)
+    if HABIT_LOG_WRITE_BEHIND:
+        return await buffer_habit_log(user_id, log_data)
+    # Insert or update the log for this date and habit in a single round trip
+    previous, log = await upsert_one(
+        db.habit_logs,
+        {"user_id": user_id, "habit_id": log_data.habit_id, "date": log_data.date},
+        {"completed": log_data.completed}
     )
-    await db.habit_logs.insert_one(log.model_dump())
+    await rollup_habit_log(user_id, log_data.date, log_data.habit_id, log_data.completed)
+    if (previous or {}).get("completed", False) != log_data.completed:
+        await update_streaks(user_id, log_data.habit_id, log_data.date, log_data.completed)
+    await bump_data_version(user_id)
+    return HabitLog(**log)
+
+async def buffer_habit_log(user_id: str, log_data: HabitLogCreate) -> HabitLog:
+    # The document's id, created_at and stored completion come from the
+    # buffer while it has this key, otherwise from one indexed read; a new
+    # log gets them here and keeps them when the flush inserts it. A value
+    # already being written is what the flush will find stored.
+    key = (user_id, log_data.habit_id, log_data.date)
+    known, in_flight = habit_log_writes.lookup(key)
+    if in_flight:
+        known = {**known, "stored_completed": known["completed"]}
+    if known is None:
+        known = await db.habit_logs.find_one(
+            {"user_id": user_id, "habit_id": log_data.habit_id, "date": date_storage.match_day(log_data.date)},
+            {"_id": 0, "id": 1, "created_at": 1, "completed": 1}
+        )
+        if known:
+            decode_dates(known)
+            known["stored_completed"] = known["completed"]
+    log = HabitLog(user_id=user_id, **log_data.model_dump(), **{
+        field: known[field] for field in ("id", "created_at") if known
+    })
+    stored_completed = known["stored_completed"] if known else False
+    await habit_log_writes.put(key, {**log.model_dump(), "stored_completed": stored_completed})
     return log
 
+@api_router.post("/habit-logs/batch")
+async def create_habit_logs_batch(batch: HabitLogBatch, user_id: str = Depends(get_current_user)):
+    return batch_response(await apply_habit_log_batch(user_id, batch.logs))
+
+@api_router.post("/habit-logs/import")
+async def import_habit_logs(
+    request: Request,
+    format: str = Query("ndjson", pattern=f"^({'|'.join(FORMATS)})$"),
+    user_id: str = Depends(get_current_user)
+):
+    return await import_records(request, format, HabitLogCreate, lambda entries: apply_habit_log_batch(user_id, entries))
+
 # ============ MOOD LOGS ROUTES ============
 
 @api_router.get("/mood-logs", response_model=List[MoodLog])
-async def get_mood_logs(user_id: str = Depends(get_current_user)):
-    logs = await db.mood_logs.find({"user_id": user_id}, {"_id": 0}).to_list(10000)
-    return logs
+async def get_mood_logs(
+    response: Response,
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    cursor: Optional[str] = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user_id: str = Depends(get_current_user_if_modified)
+):
+    logs = await find_page(db.mood_logs, MoodLog, {"user_id": user_id}, response, from_date, to_date, cursor, limit)
+    return list_response(logs, response)
 
 @api_router.post("/mood-logs", response_model=MoodLog)
 async def create_mood_log(log_data: MoodLogCreate, user_id: str = Depends(get_current_user)):
-    # Check if log already exists for this date
-    existing = await db.mood_logs.find_one({
-        "user_id": user_id,
-        "date": log_data.date
-    }, {"_id": 0})
-    
-    if existing:
-        # Update existing log
-        await db.mood_logs.update_one(
-            {"id": existing["id"]},
-            {"$set": {
-                "mood_level": log_data.mood_level,
-                "emoji": log_data.emoji,
-                "note": log_data.note
-            }}
-        )
-        return MoodLog(
-            id=existing["id"],
-            user_id=user_id,
-            date=log_data.date,
-            mood_level=log_data.mood_level,
-            emoji=log_data.emoji,
-            note=log_data.note,
-            created_at=existing["created_at"]
-        )
-    
-    # Create new log
-    log = MoodLog(
-        user_id=user_id,
-        date=log_data.date,
-        mood_level=log_data.mood_level,
-        emoji=log_data.emoji,
-        note=log_data.note
+    # Insert or update the log for this date in a single round trip
+    log_data.date = require_day(log_data.date)
+    _, log = await upsert_one(
+        db.mood_logs,
+        {"user_id": user_id, "date": log_data.date},
+        {
+            "mood_level": log_data.mood_level,
+            "emoji": log_data.emoji,
+            "note": log_data.note
+        }
     )
-    await db.mood_logs.insert_one(log.model_dump())
-    return log
+    await rollup_mood_log(user_id, log_data.date, log_data.mood_level)
+    await bump_data_version(user_id)
+    return MoodLog(**log)
 
 @api_router.delete("/mood-logs/{date}")
 async def delete_mood_log(date: str, user_id: str = Depends(get_current_user)):
-    result = await db.mood_logs.delete_one({"date": date, "user_id": user_id})
-    if result.deleted_count == 0:
+    date = require_day(date)
+    log = await db.mood_logs.find_one_and_delete(
+        {"date": date_storage.match_day(date), "user_id": user_id}, projection={"_id": 0, "id": 1}
+    )
+    if not log:
         raise HTTPException(status_code=404, detail="Mood log not found")
+    await record_tombstone(user_id, "mood_logs", log["id"])
+    await rollup_mood_log(user_id, date, None)
+    await bump_data_version(user_id)
     return {"success": True}
 
+@api_router.post("/mood-logs/batch")
+async def create_mood_logs_batch(batch: MoodLogBatch, user_id: str = Depends(get_current_user)):
+    return batch_response(await apply_mood_log_batch(user_id, batch.logs))
+
+@api_router.post("/mood-logs/import")
+async def import_mood_logs(
+    request: Request,
+    format: str = Query("ndjson", pattern=f"^({'|'.join(FORMATS)})$"),
+    user_id: str = Depends(get_current_user)
+):
+    return await import_records(request, format, MoodLogCreate, lambda entries: apply_mood_log_batch(user_id, entries))
+
+# ============ SYNC ROUTES ============
+
+@api_router.get("/sync")
+async def sync_changes(
+    since: Optional[str] = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user_id: str = Depends(get_current_user_flushed)
+):
+    token = decode_sync_token(since) if since else None
+    if token and "p" in token:
+        # Continuation of a paged sync: same window, same next-sync token
+        started, since_time, positions = token["t"], token["s"], token["p"]
+        pending = list(positions)
+    else:
+        started = datetime.now(timezone.utc).isoformat(timespec="microseconds")
+        retention_start = (datetime.fromisoformat(started) - timedelta(days=SYNC_TOMBSTONE_RETENTION_DAYS)).isoformat(timespec="microseconds")
+        since_time = token["t"] if token and token["t"] >= retention_start else None
+        if since_time:
+            window_start = datetime.fromisoformat(since_time) - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+            since_time = window_start.isoformat(timespec="microseconds")
+        positions = {}
+        # A full snapshot replaces the client's copy, so deletions are implied
+        pending = list(SYNC_COLLECTIONS if since_time else SYNC_COLLECTIONS[:-1])
+    full = since_time is None
+    
+    projections = {
+        "habits": {"_id": 0},
+        "habit_logs": model_projection(HabitLog),
+        "mood_logs": model_projection(MoodLog),
+        "tombstones": {"_id": 0, "collection": 1, "id": 1, "deleted_at": 1}
+    }
+    
+    async def page(name: str) -> list:
+        field = "deleted_at" if name == "tombstones" else "updated_at"
+        conditions = [{"user_id": user_id}]
+        if since_time:
+            conditions.append({field: {"$gte": since_time}})
+        if name in positions:
+            conditions.append(sync_after(field, positions[name]))
+        return await db[name].find({"$and": conditions}, projections[name]) \
+            .sort([(field, 1), ("id", 1)]).limit(limit + 1).to_list(limit + 1)
+    
+    pages = dict(zip(pending, await asyncio.gather(*(page(name) for name in pending))))
+    next_positions = {}
+    for name, docs in pages.items():
+        if len(docs) > limit:
+            del docs[limit:]
+            field = "deleted_at" if name == "tombstones" else "updated_at"
+            next_positions[name] = [docs[-1].get(field), docs[-1]["id"]]
+    
+    habits = pages.get("habits", [])
+    for doc in (*habits, *pages.get("habit_logs", []), *pages.get("mood_logs", [])):
+        decode_dates(doc)
+    for habit in habits:
+        habit["current_streak"] = effective_current_streak(habit)
+    
+    deleted = {"habits": [], "habit_logs": [], "mood_logs": []}
+    for tombstone in pages.get("tombstones", []):
+        deleted[tombstone["collection"]].append(tombstone["id"])
+    
+    more = bool(next_positions)
+    return {
+        "token": encode_sync_token(started, since_time, next_positions) if more else encode_sync_token(started),
+        "full": full,
+        "more": more,
+        "habits": habits,
+        "habit_logs": pages.get("habit_logs", []),
+        "mood_logs": pages.get("mood_logs", []),
+        "deleted": deleted
+    }
+
+# ============ EXPORT ROUTES ============
+
+@api_router.get("/export")
+async def export_data(
+    request: Request,
+    format: str = Query("ndjson", pattern=f"^({'|'.join(FORMATS)})$"),
+    user_id: str = Depends(get_current_user_flushed)
+):
+    body = encode(export_records(user_id), format)
+    headers = {"Content-Disposition": f'attachment; filename="habitmap-export.{format}"'}
+    if "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip_chunks(body)
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(body, media_type=MEDIA_TYPES[format], headers=headers)
+
+# ============ DASHBOARD ROUTES ============
+
+@api_router.get("/dashboard")
+async def get_dashboard(
+    request: Request,
+    days: int = Query(31, ge=1, le=366),
+    user_id: str = Depends(get_current_user_if_modified)
+):
+    # Everything the dashboard needs in one round trip; the four queries
+    # are independent, so they run concurrently
+    today = datetime.now(timezone.utc).date()
+    window_start = (today - timedelta(days=days - 1)).isoformat()
+    thirty_days_ago = (today - timedelta(days=30)).isoformat()
+    
+    def window(day) -> dict:
+        return {"user_id": user_id, "date": {"$gte": day(window_start)}}
+    
+    habits, habit_logs, mood_logs, rollups = await asyncio.gather(
+        list_habits(user_id, request.state.data_version),
+        date_storage.find(db.habit_logs, window, model_projection(HabitLog), [("date", 1)]),
+        date_storage.find(db.mood_logs, window, model_projection(MoodLog), [("date", 1)]),
+        get_recent_rollups(user_id, thirty_days_ago)
+    )
+    
+    today_str = today.isoformat()
+    rollup_today = next((day for day in rollups if day["date"] == today_str), None)
+    moods = [day["mood_level"] for day in rollups if day.get("mood_level") is not None]
+    completed_today = rollup_today["completed_habit_ids"] if rollup_today else []
+    
+    return {
+        "habits": habits,
+        "habit_logs": habit_logs,
+        "mood_logs": mood_logs,
+        "today": {
+            "date": today_str,
+            "completed_habit_ids": completed_today,
+            "completed": len(completed_today),
+            "total_habits": len(habits),
+            "mood_level": rollup_today.get("mood_level") if rollup_today else None
+        },
+        "summary": {
+            "total_completions": sum(day["completion_count"] for day in rollups),
+            "active_days": sum(1 for day in rollups if day["completion_count"] > 0),
+            "mood_entries": len(moods),
+            "avg_mood": round(sum(moods) / len(moods), 1) if moods else 0
+        }
+    }
+
 # ============ ANALYTICS ROUTES ============
 
 @api_router.get("/analytics/summary")
-async def get_analytics_summary(user_id: str = Depends(get_current_user)):
-    # Get all habits
-    habits = await db.habits.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    
-    # Get habit logs for the last 30 days
+async def get_analytics_summary(user_id: str = Depends(get_current_user_if_modified)):
     thirty_days_ago = (datetime.now(timezone.utc) - timedelta(days=30)).date().isoformat()
-    habit_logs = await db.habit_logs.find({
-        "user_id": user_id,
-        "date": {"$gte": thirty_days_ago}
-    }, {"_id": 0}).to_list(10000)
     
-    # Get mood logs for the last 30 days
-    mood_logs = await db.mood_logs.find({
-        "user_id": user_id,
-        "date": {"$gte": thirty_days_ago}
-    }, {"_id": 0}).to_list(10000)
+    # Everything except the mood trend comes from the daily rollups, one
+    # small document per day; mood_logs is unique per day so the trend is
+    # bounded the same way
+    habits, rollups, mood_logs = await asyncio.gather(
+        db.habits.find({"user_id": user_id}, {"_id": 0, "id": 1, "name": 1}).to_list(1000),
+        get_recent_rollups(user_id, thirty_days_ago),
+        date_storage.find(
+            db.mood_logs, lambda day: {"user_id": user_id, "date": {"$gte": day(thirty_days_ago)}},
+            {"_id": 0}, [("date", 1)], 1000
+        )
+    )
+    
+    logged = Counter()
+    completed = Counter()
+    for day in rollups:
+        logged.update(day["logged_habit_ids"])
+        completed.update(day["completed_habit_ids"])
+    moods = [day["mood_level"] for day in rollups if day.get("mood_level") is not None]
     
-    # Calculate statistics
-    total_habits = len(habits)
-    total_completions = sum(1 for log in habit_logs if log["completed"])
-    avg_mood = sum(log["mood_level"] for log in mood_logs) / len(mood_logs) if mood_logs else 0
+    total_completions = sum(day["completion_count"] for day in rollups)
+    avg_mood = sum(moods) / len(moods) if moods else 0
     
     # Calculate completion rate by habit
     habit_stats = {}
     for habit in habits:
-        habit_logs_filtered = [log for log in habit_logs if log["habit_id"] == habit["id"]]
-        completed_count = sum(1 for log in habit_logs_filtered if log["completed"])
-        total_count = len(habit_logs_filtered)
+        completed_count = completed[habit["id"]]
+        total_count = logged[habit["id"]]
         completion_rate = (completed_count / total_count * 100) if total_count > 0 else 0
         habit_stats[habit["id"]] = {
             "name": habit["name"],
@@ -325,96 +1752,132 @@ async def get_analytics_summary(user_id: str = Depends(get_current_user)):
         }
     
     return {
-        "total_habits": total_habits,
+        "total_habits": len(habits),
         "total_completions": total_completions,
         "avg_mood": round(avg_mood, 1),
         "habit_stats": habit_stats,
         "mood_trend": mood_logs
     }
 
+@api_router.get("/analytics/correlations")
+async def get_correlations(
+    from_date: Optional[str] = Query(None, alias="from"),
+    to_date: Optional[str] = Query(None, alias="to"),
+    user_id: str = Depends(get_current_user_if_modified)
+):
+    start, end, days = parse_day_range(from_date, to_date, default_days=31)
+    habits, rollups = await asyncio.gather(
+        db.habits.find({"user_id": user_id}, {"_id": 0, "id": 1, "name": 1}).to_list(1000),
+        date_storage.find(
+            db.daily_rollups,
+            lambda day: {"user_id": user_id, "date": {"$gte": day(start.isoformat()), "$lte": day(end.isoformat())}},
+            {"_id": 0}, [("date", 1)], days
+        )
+    )
+    return habit_mood_correlations(rollups, habits, start, end)
+
 @api_router.get("/analytics/ai-insights")
-async def get_ai_insights(user_id: str = Depends(get_current_user)):
-    # Get data for the last 30 days
-    thirty_days_ago = (datetime.now(timezone.utc) - timedelta(days=30)).date().isoformat()
-    
-    habits = await db.habits.find({"user_id": user_id}, {"_id": 0}).to_list(1000)
-    habit_logs = await db.habit_logs.find({
-        "user_id": user_id,
-        "date": {"$gte": thirty_days_ago}
-    }, {"_id": 0}).to_list(10000)
-    mood_logs = await db.mood_logs.find({
-        "user_id": user_id,
-        "date": {"$gte": thirty_days_ago}
-    }, {"_id": 0}).to_list(10000)
-    
-    if not habits or not mood_logs:
-        return {"insights": "Not enough data yet. Start tracking your habits and mood to get AI insights!"}
-    
-    # Prepare data summary
-    habit_names = [h["name"] for h in habits]
-    completed_habits = {}
-    for log in habit_logs:
-        if log["completed"]:
-            habit_name = next((h["name"] for h in habits if h["id"] == log["habit_id"]), "Unknown")
-            date = log["date"]
-            if date not in completed_habits:
-                completed_habits[date] = []
-            completed_habits[date].append(habit_name)
-    
-    mood_by_date = {log["date"]: log["mood_level"] for log in mood_logs}
+async def get_ai_insights(user_id: str = Depends(get_current_user_flushed)):
+    result, job = await submit_insights(user_id)
+    if job is None:
+        return result
     
-    # Create prompt for GPT-5
-    prompt = f"""
-You are a wellness coach analyzing a user's habit and mood data.
-
-User's Habits: {', '.join(habit_names)}
+    await job.done.wait()
+    if job.status == FAILED:
+        logging.error(f"AI insights error: {job.error}")
+        return insights_result(INSIGHTS_UNAVAILABLE)
+    return job.result
 
-Last 30 days data:
-- Total mood entries: {len(mood_logs)}
-- Average mood level: {sum(m['mood_level'] for m in mood_logs) / len(mood_logs):.1f}/5
-- Total habit completions: {sum(1 for log in habit_logs if log['completed'])}
-
-Correlation data (sample):
-"""
-    
-    # Add sample correlations
-    sample_count = 0
-    for date in sorted(mood_by_date.keys(), reverse=True)[:10]:
-        if date in completed_habits:
-            prompt += f"\n- {date}: Mood {mood_by_date[date]}/5, Completed: {', '.join(completed_habits[date])}"
-            sample_count += 1
-    
-    if sample_count == 0:
-        prompt += "\nNo habit completions found in recent mood entries."
+@api_router.get("/analytics/ai-insights/stream")
+async def stream_ai_insights(request: Request, user_id: str = Depends(get_current_user_flushed)):
+    # Server-Sent Events: a `meta` event, one `data` event per chunk as the
+    # model produces it, then `done` (or `error`). If the client goes away
+    # the generator is cancelled, which closes the upstream stream as well.
+    inputs = await load_insights_inputs(user_id)
     
-    prompt += "\n\nProvide 3-4 brief, actionable insights about:\n1. Which habits seem to correlate with better mood\n2. Consistency patterns\n3. Recommendations for improvement\n\nKeep it warm, encouraging, and under 200 words."
-    
-    try:
-        # Initialize LLM chat with GPT-5
-        chat = LlmChat(
-            api_key=os.environ['EMERGENT_LLM_KEY'],
-            session_id=f"insights_{user_id}",
-            system_message="You are a supportive wellness coach providing personalized habit insights."
-        ).with_model("openai", "gpt-5")
+    async def events():
+        if inputs is None:
+            yield sse_event({"cached": False, "cache_age_seconds": None}, "meta")
+            yield sse_event({"text": INSIGHTS_NOT_ENOUGH_DATA})
+            yield sse_event({}, "done")
+            return
         
-        user_message = UserMessage(text=prompt)
-        response = await chat.send_message(user_message)
+        key = insights_fingerprint(inputs)
+        entry = await insights_cache.get(key)
+        if entry is not None:
+            yield sse_event({"cached": True, "cache_age_seconds": round(entry.age_seconds)}, "meta")
+            yield sse_event({"text": entry.value})
+            yield sse_event({}, "done")
+            return
         
-        return {"insights": response}
-    except Exception as e:
-        logging.error(f"AI insights error: {str(e)}")
-        return {"insights": "Unable to generate AI insights at this time. Please try again later."}
+        yield sse_event({"cached": False, "cache_age_seconds": 0}, "meta")
+        # Identical inputs already being answered (queued job or another
+        # stream): wait for that answer and send it as a single chunk
+        pending = insight_jobs.active(key)
+        if pending is not None:
+            pending.owners.add(user_id)
+            await pending.done.wait()
+            if pending.status == FAILED:
+                yield sse_event({"message": INSIGHTS_UNAVAILABLE}, "error")
+                return
+            yield sse_event({"text": pending.result["insights"]})
+            yield sse_event({}, "done")
+            return
+        
+        chunks = []
+        async with insight_jobs.running(key, user_id) as job:
+            upstream = stream_completion(llm_client, f"insights_{user_id}", INSIGHTS_SYSTEM_MESSAGE, build_insights_prompt(inputs))
+            started = time.perf_counter()
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(upstream.__anext__(), AI_INSIGHTS_TIMEOUT_SECONDS)
+                    except StopAsyncIteration:
+                        break
+                    if await request.is_disconnected():
+                        job.error = "Client disconnected"
+                        return
+                    chunks.append(chunk)
+                    yield sse_event({"text": chunk})
+            except Exception as e:
+                logging.error(f"AI insights stream error: {str(e)}")
+                LLM_ERRORS.labels(operation="stream").inc()
+                job.error = str(e)
+                yield sse_event({"message": INSIGHTS_UNAVAILABLE}, "error")
+                return
+            finally:
+                LLM_LATENCY.labels(operation="stream").observe(time.perf_counter() - started)
+                await upstream.aclose()
+            
+            job.result = insights_result("".join(chunks), False, 0)
+            await insights_cache.set(key, job.result["insights"])
+        yield sse_event({}, "done")
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.post("/analytics/ai-insights/jobs")
+async def create_ai_insights_job(user_id: str = Depends(get_current_user_flushed)):
+    result, job = await submit_insights(user_id)
+    if job is None:
+        return {"job_id": None, "status": DONE, "result": result, "error": None}
+    return job.to_dict()
+
+@api_router.get("/analytics/ai-insights/jobs/{job_id}")
+async def get_ai_insights_job(job_id: str, user_id: str = Depends(get_current_user)):
+    job = insight_jobs.get(job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
 # ============ SETTINGS ROUTES ============
 
 @api_router.get("/settings")
-async def get_settings(user_id: str = Depends(get_current_user)):
-    settings = await db.settings.find_one({"user_id": user_id}, {"_id": 0})
-    if not settings:
-        # Create default settings
-        settings = UserSettings(user_id=user_id)
-        await db.settings.insert_one(settings.model_dump())
-    return settings
+async def get_settings(request: Request, user_id: str = Depends(get_current_user_if_modified)):
+    return await settings_cache.get(user_id, lambda: load_settings(user_id), request.state.data_version)
 
 @api_router.put("/settings")
 async def update_settings(settings_data: SettingsUpdate, user_id: str = Depends(get_current_user)):
@@ -429,18 +1892,72 @@ async def update_settings(settings_data: SettingsUpdate, user_id: str = Depends(
     )
     if not result:
         raise HTTPException(status_code=404, detail="Settings not found")
+    await settings_cache.invalidate(user_id)
+    await bump_data_version(user_id)
     result.pop("_id", None)
     return result
 
+# ============ HEALTH ROUTES ============
+
+@api_router.get("/health/live")
+async def liveness():
+    # The process is up and serving; says nothing about its dependencies
+    return {"status": "ok"}
+
+@api_router.get("/health/ready")
+async def readiness(response: Response):
+    # Ready once the MongoDB warm-up has verified indexes and loaded the
+    # revocation list, and while MongoDB keeps answering. The LLM client
+    # warms up in the background too but does not gate traffic.
+    checks = {"startup": app.state.startup_status, "llm": app.state.llm_status}
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), READINESS_TIMEOUT_SECONDS)
+        checks["mongo"] = "ok"
+    except Exception as e:
+        checks["mongo"] = f"unavailable: {str(e)}"
+    ready = app.state.ready and checks["mongo"] == "ok"
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {"status": "ready" if ready else "not ready", "checks": checks}
+
+# ============ ADMIN ROUTES ============
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@api_router.get("/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles(limit: int = Query(20, ge=1, le=PROFILE_HISTORY)):
+    # Slowest of the recently profiled requests, with their phase timings
+    return [profile.summary() for profile in profile_store.slowest(limit)]
+
+@api_router.get("/admin/profiles/{profile_id}/flamegraph", dependencies=[Depends(require_admin)])
+async def get_profile_flamegraph(profile_id: str):
+    # Folded stacks, one "frame;frame;... count" line per distinct stack
+    if profile_store.get(profile_id) is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(profile_store.path_for(profile_id), media_type="text/plain", filename=f"{profile_id}.folded")
+
 # Include router
 app.include_router(api_router)
 
+# Served outside /api so it is only reachable from inside the cluster
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return metrics_response()
+
+app.add_middleware(PrometheusMiddleware)
+app.add_middleware(ProfilingMiddleware, store=profile_store, secret=ADMIN_TOKEN, sample_rate=PROFILE_SAMPLE_RATE)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 logging.basicConfig(
@@ -449,6 +1966,53 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+app.state.ready = False
+app.state.startup_status = "pending"
+app.state.llm_status = "pending"
+
+async def warm_up_mongo():
+    # Retries until MongoDB answers, so the process stays live (and not
+    # ready) through a database outage at boot instead of exiting
+    while True:
+        app.state.startup_status = "warming"
+        try:
+            await client.admin.command("ping")
+            await ensure_indexes()
+            await date_storage.load(db)
+            await revocations.refresh()
+            break
+        except Exception as e:
+            logger.error(f"MongoDB warm-up failed: {str(e)}")
+            app.state.startup_status = f"unavailable: {str(e)}"
+            await asyncio.sleep(MONGO_WARM_UP_RETRY_SECONDS)
+    app.state.revocation_refresher = asyncio.create_task(revocations.run())
+    app.state.startup_status = "ok"
+    app.state.ready = True
+
+async def warm_up_llm():
+    app.state.llm_status = "warming"
+    try:
+        await llm_client.warm_up()
+        app.state.llm_status = "ok"
+    except Exception as e:
+        logger.error(f"LLM client warm-up failed: {str(e)}")
+        app.state.llm_status = f"unavailable: {str(e)}"
+
+@app.on_event("startup")
+async def startup_db_client():
+    app.state.llm_warm_up = asyncio.create_task(warm_up_llm())
+    app.state.mongo_warm_up = asyncio.create_task(warm_up_mongo())
+    app.state.loop_monitor = asyncio.create_task(monitor_event_loop())
+    await insight_jobs.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    app.state.mongo_warm_up.cancel()
+    if hasattr(app.state, "revocation_refresher"):
+        app.state.revocation_refresher.cancel()
+    app.state.loop_monitor.cancel()
+    app.state.llm_warm_up.cancel()
+    await habit_log_writes.stop()
+    await insight_jobs.stop()
+    bcrypt_executor.shutdown(wait=False)
     client.close()
\ No newline at end of file
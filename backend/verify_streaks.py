@@ -0,0 +1,28 @@
+"""Check stored habit streaks against a full recomputation from habit_logs.
+
+Usage (from the backend directory):
+    python verify_streaks.py [--user-id USER_ID] [--fix]
+"""
+import argparse
+import asyncio
+import sys
+
+from server import client, date_storage, db, verify_streaks, logger
+
+
+async def main(user_id=None, fix=False):
+    await date_storage.load(db)
+    mismatches = await verify_streaks(user_id, fix=fix)
+    for mismatch in mismatches:
+        logger.warning(f"Habit {mismatch['habit_id']}: stored {mismatch['stored']}, expected {mismatch['expected']}")
+    logger.info(f"{len(mismatches)} habit(s) with mismatched streaks{' fixed' if fix and mismatches else ''}")
+    client.close()
+    return 1 if mismatches and not fix else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--user-id", help="Only check habits of this user")
+    parser.add_argument("--fix", action="store_true", help="Overwrite mismatched streaks with the recomputed values")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.user_id, args.fix)))
@@ -0,0 +1,111 @@
+"""In-process write-behind buffer that coalesces upserts.
+
+`put` stores a value under its key and returns at once; a later put for the
+same key replaces it (last writer wins). Pending values are handed to the
+`write` callback together, `interval_seconds` after the first one arrived
+or as soon as `max_entries` are pending, whichever comes first. Keys are
+tuples whose first item is the user id, so `flush(user_id)` can write one
+user's values ahead of a read that must see them.
+
+A flush first waits for writes already in flight for the same users, so it
+returns only after every value put before it was written, and values for a
+key reach `write` in the order they were put. Flushes for different users
+run concurrently.
+If `write` raises, its values go back into the buffer (unless newer values
+arrived for the same keys) and are retried on the next flush. `stop` writes
+everything that is still pending.
+
+The buffer lives in one process: values are lost if the process dies before
+they are written, and each worker coalesces only its own requests.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    def __init__(self, write: Callable[[List[Any]], Awaitable[None]], max_entries: int = 500,
+                 interval_seconds: float = 0.05):
+        self._write = write
+        self.max_entries = max_entries
+        self.interval_seconds = interval_seconds
+        self._pending: Dict[Tuple[Hashable, ...], Any] = {}
+        self._in_flight: List[Tuple[Dict[Tuple[Hashable, ...], Any], Set[Hashable], asyncio.Event]] = []
+        self._timer: Optional[asyncio.Task] = None
+        self.puts = 0
+        self.writes = 0
+
+    def get(self, key: Tuple[Hashable, ...]) -> Optional[Any]:
+        # The latest value put for the key while it is pending or being written
+        return self.lookup(key)[0]
+
+    def lookup(self, key: Tuple[Hashable, ...]) -> Tuple[Optional[Any], bool]:
+        # (value, in_flight): in_flight is True when the latest value is
+        # already being written rather than still pending
+        if key in self._pending:
+            return self._pending[key], False
+        for batch, _, _ in reversed(self._in_flight):
+            if key in batch:
+                return batch[key], True
+        return None, False
+
+    def has_pending(self, user_id: Optional[Hashable] = None) -> bool:
+        if user_id is None:
+            return bool(self._pending)
+        return any(key[0] == user_id for key in self._pending)
+
+    async def put(self, key: Tuple[Hashable, ...], value: Any):
+        self._pending[key] = value
+        self.puts += 1
+        if len(self._pending) >= self.max_entries:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.interval_seconds)
+        self._timer = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Write-behind flush failed: {str(e)}")
+
+    async def flush(self, user_id: Optional[Hashable] = None):
+        while True:
+            waiting = [done for _, users, done in self._in_flight if user_id is None or user_id in users]
+            if not waiting:
+                break
+            for done in waiting:
+                await done.wait()
+
+        # Nothing awaits from here until the batch is registered as in flight
+        if user_id is None:
+            batch, self._pending = self._pending, {}
+        else:
+            batch = {key: value for key, value in self._pending.items() if key[0] == user_id}
+            for key in batch:
+                del self._pending[key]
+        if not batch:
+            return
+        writing = (batch, {key[0] for key in batch}, asyncio.Event())
+        self._in_flight.append(writing)
+        try:
+            await self._write(list(batch.values()))
+        except BaseException:
+            for key, value in batch.items():
+                self._pending.setdefault(key, value)
+            if self._timer is None:
+                self._timer = asyncio.create_task(self._flush_later())
+            raise
+        finally:
+            self._in_flight.remove(writing)
+            writing[2].set()
+        self.writes += len(batch)
+
+    async def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
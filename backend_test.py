@@ -198,6 +198,28 @@ class HabitMapAPITester:
             200
         )
         
+        # Get habit logs for a date range and habit
+        range_success, range_logs = self.run_test(
+            "Get Habit Logs (date range)",
+            "GET",
+            f"/habit-logs?from={today}&to={today}&habit_id={habit_id}&limit=1",
+            200
+        )
+        success = success and range_success and len(range_logs) == 1
+
+        # Batch upsert: today's log is updated, the unknown habit is rejected
+        batch_success, batch = self.run_test(
+            "Create Habit Logs (batch)",
+            "POST",
+            "/habit-logs/batch",
+            200,
+            data={"logs": [
+                {"habit_id": habit_id, "date": today, "completed": False},
+                {"habit_id": "missing", "date": today, "completed": True}
+            ]}
+        )
+        success = success and batch_success and batch.get('updated') == 1 and batch.get('failed') == 1
+
         # Clean up - delete the habit
         requests.delete(
             f"{self.api_url}/habits/{habit_id}",
@@ -287,6 +309,26 @@ class HabitMapAPITester:
         
         return success
 
+    def test_dashboard(self):
+        """Test aggregated dashboard endpoint"""
+        success, dashboard = self.run_test(
+            "Get Dashboard",
+            "GET",
+            "/dashboard?days=31",
+            200
+        )
+        
+        if not success:
+            return False
+
+        expected_keys = ['habits', 'habit_logs', 'mood_logs', 'today', 'summary']
+        if not all(key in dashboard for key in expected_keys):
+            self.log_test("Dashboard Structure", False, "Missing expected keys")
+            return False
+        
+        self.log_test("Dashboard Structure", True)
+        return True
+
     def test_settings(self):
         """Test settings endpoints"""
         # Get settings
@@ -347,6 +389,9 @@ class HabitMapAPITester:
         print("\n📈 Testing Analytics...")
         self.test_analytics()
 
+        print("\n🏠 Testing Dashboard...")
+        self.test_dashboard()
+
         print("\n⚙️ Testing Settings...")
         self.test_settings()
 
@@ -9,6 +9,9 @@ import Insights from '@/pages/Insights';
 import Settings from '@/pages/Settings';
 import Layout from '@/components/Layout';
 
+const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
+const API = `${BACKEND_URL}/api`;
+
 function App() {
   const [token, setToken] = useState(localStorage.getItem('token'));
 
@@ -25,6 +28,11 @@ function App() {
   };
 
   const handleLogout = () => {
+    // Revoke the token server-side; local logout proceeds either way
+    fetch(`${API}/auth/logout`, {
+      method: 'POST',
+      headers: { Authorization: `Bearer ${token}` }
+    }).catch(() => {});
     setToken(null);
     localStorage.removeItem('token');
   };
@@ -19,14 +19,12 @@ export default function Dashboard({ token }) {
 
   const fetchData = async () => {
     try {
-      const [habitsRes, logsRes, moodRes] = await Promise.all([
-        axios.get(`${API}/habits`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/habit-logs`, { headers: { Authorization: `Bearer ${token}` } }),
-        axios.get(`${API}/mood-logs`, { headers: { Authorization: `Bearer ${token}` } })
-      ]);
-      setHabits(habitsRes.data);
-      setHabitLogs(logsRes.data);
-      setMoodLogs(moodRes.data);
+      const response = await axios.get(`${API}/dashboard?days=31`, {
+        headers: { Authorization: `Bearer ${token}` }
+      });
+      setHabits(response.data.habits);
+      setHabitLogs(response.data.habit_logs);
+      setMoodLogs(response.data.mood_logs);
     } catch (error) {
       toast.error('Failed to load data');
     } finally {
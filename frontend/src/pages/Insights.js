@@ -31,11 +31,34 @@ export default function Insights({ token }) {
 
   const fetchAIInsights = async () => {
     setLoadingAI(true);
+    setAiInsights('');
     try {
-      const response = await axios.get(`${API}/analytics/ai-insights`, {
+      // Stream Server-Sent Events so text shows up as soon as the first chunk arrives
+      const response = await fetch(`${API}/analytics/ai-insights/stream`, {
         headers: { Authorization: `Bearer ${token}` }
       });
-      setAiInsights(response.data.insights);
+      if (!response.ok || !response.body) throw new Error('Stream failed');
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const raw of events) {
+          const lines = raw.split('\n');
+          const event = lines.find(l => l.startsWith('event: '))?.slice(7) || 'message';
+          const data = JSON.parse(lines.find(l => l.startsWith('data: '))?.slice(6) || '{}');
+          if (event === 'error') throw new Error(data.message);
+          if (event === 'message') {
+            setAiInsights(prev => prev + data.text);
+            setLoadingAI(false);
+          }
+        }
+      }
     } catch (error) {
       toast.error('Failed to generate AI insights');
     } finally {
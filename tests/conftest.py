@@ -0,0 +1,122 @@
+import os
+import sys
+import time
+from datetime import datetime
+
+import pytest
+
+# The backend modules are imported the way the backend runs them, as
+# top-level modules from the backend directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost")
+os.environ.setdefault("DB_NAME", "habitmap_test")
+os.environ.setdefault("JWT_SECRET", "test-secret")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("LLM_CLIENT", "stub")
+os.environ.setdefault("LLM_STUB_DELAY_SECONDS", "0")
+
+
+def _patch_mongomock():
+    # mongomock does not implement two operators the server's pipelines use,
+    # and numbers bulk upserts by their position among the upserts instead
+    # of among all operations
+    import mongomock.aggregate as aggregate
+    from mongomock.collection import BulkOperationBuilder
+    from pymongo.errors import BulkWriteError
+
+    handle_set_operator = aggregate._Parser._handle_set_operator
+    parse = aggregate._Parser.parse
+
+    def set_operator(self, operator, values):
+        if operator == "$setDifference":
+            left, right = (self.parse(value) for value in values)
+            return [value for i, value in enumerate(left) if value not in right and value not in left[:i]]
+        return handle_set_operator(self, operator, values)
+
+    def parse_with_convert(self, expression):
+        if isinstance(expression, dict) and "$convert" in expression:
+            spec = expression["$convert"]
+            value = self.parse(spec["input"])
+            if isinstance(value, datetime):
+                return value
+            try:
+                return datetime.strptime(value, "%Y-%m-%d")
+            except (TypeError, ValueError):
+                return self.parse(spec["onError"])
+        return parse(self, expression)
+
+    execute = BulkOperationBuilder.execute
+
+    def execute_with_indexes(self, write_concern=None):
+        def tagged(index, run):
+            def tagged_run():
+                result = run()
+                if result.get("upserted"):
+                    result["upserted"] = (index, result["upserted"])
+                return result
+            tagged_run.__name__ = run.__name__
+            return tagged_run
+
+        def renumber(result):
+            result["upserted"] = [{"index": item["_id"][0], "_id": item["_id"][1]} for item in result["upserted"]]
+            return result
+
+        self.executors = [tagged(index, run) for index, run in enumerate(self.executors)]
+        try:
+            return renumber(execute(self, write_concern))
+        except BulkWriteError as e:
+            renumber(e.details)
+            raise
+
+    aggregate._Parser._handle_set_operator = set_operator
+    aggregate._Parser.parse = parse_with_convert
+    BulkOperationBuilder.execute = execute_with_indexes
+
+
+@pytest.fixture(scope="session")
+def server():
+    # The API module, bound to an in-memory mongomock database
+    pytest.importorskip("mongomock_motor")
+    import motor.motor_asyncio
+    from mongomock_motor import AsyncMongoMockClient
+
+    _patch_mongomock()
+    motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+    import server as module
+    return module
+
+
+@pytest.fixture(scope="session")
+def _client(server):
+    # One app lifecycle per session: shutdown closes pools that are not
+    # reopened by the next startup
+    from fastapi.testclient import TestClient
+
+    with TestClient(server.app) as client:
+        deadline = time.time() + 5
+        while not server.app.state.ready and time.time() < deadline:
+            time.sleep(0.01)
+        yield client
+
+
+@pytest.fixture
+def api(server, _client):
+    # The test client against an empty database and empty caches
+    async def reset():
+        await server.habit_log_writes.flush()
+        for name in await server.db.list_collection_names():
+            if name != "migrations":
+                await server.db[name].delete_many({})
+        await server.user_cache.clear()
+        await server.token_cache.clear()
+        await server.insights_cache.clear()
+
+    _client.portal.call(reset)
+    return _client
+
+
+def register(api, email: str = "user@example.com") -> dict:
+    response = api.post("/api/auth/register", json={"email": email, "password": "password"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['token']}"}
@@ -0,0 +1,89 @@
+import json
+
+from tests.conftest import register
+
+
+def create_habit(api, headers, name="Read") -> str:
+    return api.post("/api/habits", json={"name": name, "color": "#fff"}, headers=headers).json()["id"]
+
+
+def test_habit_log_batch_reports_a_status_per_entry(api):
+    headers = register(api)
+    habit_id = create_habit(api, headers)
+    api.post("/api/habit-logs", json={"habit_id": habit_id, "date": "2024-01-01", "completed": True}, headers=headers)
+    other = register(api, "other@example.com")
+    foreign_id = create_habit(api, other, "Theirs")
+
+    response = api.post("/api/habit-logs/batch", json={"logs": [
+        {"habit_id": habit_id, "date": "2024-01-01", "completed": False},
+        {"habit_id": habit_id, "date": "2024-01-02", "completed": False},
+        {"habit_id": habit_id, "date": "2024-1-2", "completed": True},
+        {"habit_id": habit_id, "date": "20240103", "completed": True},
+        {"habit_id": foreign_id, "date": "2024-01-01", "completed": True},
+        {"habit_id": "missing", "date": "2024-01-01", "completed": True}
+    ]}, headers=headers).json()
+
+    assert [result["status"] for result in response["results"]] == [
+        "updated", "superseded", "created", "error", "error", "error"
+    ]
+    assert [result.get("error") for result in response["results"][3:]] == [
+        "Invalid date", "Habit not found", "Habit not found"
+    ]
+    assert (response["created"], response["updated"], response["superseded"], response["failed"]) == (1, 1, 1, 3)
+
+    logs = {log["date"]: log["completed"] for log in api.get("/api/habit-logs", headers=headers).json()}
+    assert logs == {"2024-01-01": False, "2024-01-02": True}
+    assert api.get("/api/habit-logs", headers=other).json() == []
+
+
+def test_mood_log_batch_keeps_the_last_entry_per_day(api):
+    headers = register(api)
+    response = api.post("/api/mood-logs/batch", json={"logs": [
+        {"date": "2024-01-01", "mood_level": 2, "emoji": ":/"},
+        {"date": "2024-01-01", "mood_level": 5, "emoji": ":D"},
+        {"date": "bad", "mood_level": 3, "emoji": ":)"}
+    ]}, headers=headers).json()
+    assert [result["status"] for result in response["results"]] == ["superseded", "created", "error"]
+    [log] = api.get("/api/mood-logs", headers=headers).json()
+    assert log["mood_level"] == 5
+
+
+def test_import_reports_errors_by_line_in_order(api, server, monkeypatch):
+    monkeypatch.setattr(server, "IMPORT_BATCH_SIZE", 2)
+    headers = register(api)
+    habit_id = create_habit(api, headers)
+    lines = [
+        {"habit_id": habit_id, "date": "2024-01-01", "completed": True},
+        {"habit_id": habit_id, "date": "2024-01-02", "completed": True},
+        {"habit_id": habit_id, "date": "2024-01-03T10:00", "completed": True},
+        {"habit_id": habit_id, "date": "2024-01-04"},
+        "not json",
+        {"habit_id": "missing", "date": "2024-01-05", "completed": True},
+        {"habit_id": habit_id, "date": "2024-01-01", "completed": False}
+    ]
+    body = "\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines) + "\n"
+    response = api.post("/api/habit-logs/import", content=body, headers=headers).json()
+
+    assert [(error["line"], error["error"]) for error in response["errors"]] == [
+        (3, "Invalid date"),
+        (4, "completed: Field required"),
+        (5, "Invalid JSON"),
+        (6, "Habit not found")
+    ]
+    assert (response["lines"], response["created"], response["updated"], response["failed"]) == (7, 2, 1, 4)
+
+
+def test_import_keeps_the_first_errors_when_capped(api, server, monkeypatch):
+    monkeypatch.setattr(server, "IMPORT_BATCH_SIZE", 3)
+    monkeypatch.setattr(server, "IMPORT_MAX_ERRORS", 2)
+    headers = register(api)
+    body = "\n".join([
+        json.dumps({"date": "2024-01-01", "mood_level": 3, "emoji": ":)"}),
+        json.dumps({"date": "bad", "mood_level": 3, "emoji": ":)"}),
+        json.dumps({"date": "2024-01-03", "emoji": ":)"}),
+        "{",
+        json.dumps({"date": "2024-01-05", "mood_level": 3, "emoji": ":)"})
+    ]) + "\n"
+    response = api.post("/api/mood-logs/import", content=body, headers=headers).json()
+    assert [error["line"] for error in response["errors"]] == [2, 3]
+    assert response["failed"] == 3
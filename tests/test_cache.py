@@ -0,0 +1,111 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+
+from cache import MemoryCache, MongoCache, ReadThroughCache
+
+
+def loader(values):
+    calls = []
+
+    async def load():
+        calls.append(values[len(calls)])
+        return calls[-1]
+
+    return load, calls
+
+
+def test_read_through_counts_hits_and_misses():
+    async def scenario():
+        cache = ReadThroughCache(MemoryCache(), "habits")
+        load, calls = loader(["a", "b"])
+        first = await cache.get("u1", load)
+        second = await cache.get("u1", load)
+        return first, second, calls, cache
+
+    first, second, calls, cache = asyncio.run(scenario())
+    assert (first, second, calls) == ("a", "a", ["a"])
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_entries_from_another_version_are_misses():
+    async def scenario():
+        cache = ReadThroughCache(MemoryCache(), "habits")
+        load, calls = loader(["v1", "v2"])
+        values = [await cache.get("u1", load, 1), await cache.get("u1", load, 1), await cache.get("u1", load, 2)]
+        return values, calls, cache
+
+    values, calls, cache = asyncio.run(scenario())
+    assert values == ["v1", "v1", "v2"]
+    assert calls == ["v1", "v2"]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_invalidate_drops_the_entry():
+    async def scenario():
+        cache = ReadThroughCache(MemoryCache(), "settings")
+        load, calls = loader(["old", "new"])
+        await cache.get("u1", load)
+        await cache.invalidate("u1")
+        return await cache.get("u1", load), calls
+
+    assert asyncio.run(scenario()) == ("new", ["old", "new"])
+
+
+def test_load_racing_an_invalidation_is_not_stored():
+    async def scenario():
+        backend = MemoryCache()
+        cache = ReadThroughCache(backend, "habits")
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def slow_load():
+            started.set()
+            await release.wait()
+            return "stale"
+
+        racing = asyncio.create_task(cache.get("u1", slow_load))
+        await started.wait()
+        await cache.invalidate("u1")
+        release.set()
+        return await racing, len(backend)
+
+    # The caller still gets its value, but it is not cached
+    assert asyncio.run(scenario()) == ("stale", 0)
+
+
+def test_mongo_hits_are_reads_and_touch_used_at_only_after_the_interval():
+    async def scenario():
+        collection = AsyncMongoMockClient()["test"]["cache"]
+        cache = MongoCache(collection, touch_seconds=60)
+        await cache.set("k", {"a": 1})
+        used_at = (await collection.find_one({"key": "k"}))["used_at"]
+        hit = await cache.get("k")
+        untouched = (await collection.find_one({"key": "k"}))["used_at"]
+
+        stale = used_at - timedelta(seconds=120)
+        await collection.update_one({"key": "k"}, {"$set": {"used_at": stale}})
+        await cache.get("k")
+        touched = (await collection.find_one({"key": "k"}))["used_at"]
+        return hit, used_at, untouched, stale, touched
+
+    hit, used_at, untouched, stale, touched = asyncio.run(scenario())
+    assert hit.value == {"a": 1} and hit.age_seconds < 5
+    assert untouched == used_at
+    assert touched > stale and isinstance(touched, datetime)
+
+
+def test_mongo_entries_expire_and_evict_least_recently_used():
+    async def scenario():
+        collection = AsyncMongoMockClient()["test"]["cache"]
+        cache = MongoCache(collection, max_entries=2)
+        await cache.set("expired", 1, ttl_seconds=-1)
+        expired = await cache.get("expired")
+        await cache.delete("expired")
+        for key in ("a", "b", "c"):
+            await cache.set(key, key)
+            time.sleep(0.002)
+        return expired, sorted(doc["key"] for doc in await collection.find({}).to_list(None))
+
+    assert asyncio.run(scenario()) == (None, ["b", "c"])
@@ -0,0 +1,94 @@
+from datetime import date, datetime, timezone
+
+import mongomock.collection
+import pytest
+
+from tests.conftest import register
+
+READ_ROUTES = ["/api/habits", "/api/habit-logs", "/api/mood-logs", "/api/dashboard", "/api/settings"]
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    # Names of the collections read from while the fixture is active
+    names = []
+    for method in ("find", "find_one", "aggregate", "count_documents", "distinct"):
+        original = getattr(mongomock.collection.Collection, method)
+
+        def recording(self, *args, _original=original, **kwargs):
+            names.append(self.name)
+            return _original(self, *args, **kwargs)
+
+        monkeypatch.setattr(mongomock.collection.Collection, method, recording)
+    return names
+
+
+def etag(api, headers, path="/api/habits") -> str:
+    response = api.get(path, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.headers["ETag"]
+
+
+def test_etag_carries_the_data_version_and_the_day(api):
+    headers = register(api)
+    today = datetime.now(timezone.utc).date().isoformat()
+    assert etag(api, headers) == f'W/"0-{today}"'
+    api.post("/api/habits", json={"name": "Read", "color": "#fff"}, headers=headers)
+    assert etag(api, headers) == f'W/"1-{today}"'
+    response = api.get("/api/habits", headers=headers)
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+
+@pytest.mark.parametrize("path", READ_ROUTES)
+def test_matching_if_none_match_gets_304_without_reading_data(api, reads, path):
+    headers = register(api)
+    habit = api.post("/api/habits", json={"name": "Read", "color": "#fff"}, headers=headers).json()
+    api.post("/api/habit-logs", json={"habit_id": habit["id"], "date": date.today().isoformat(), "completed": True},
+             headers=headers)
+    tag = etag(api, headers, path)
+
+    reads.clear()
+    response = api.get(path, headers={**headers, "If-None-Match": tag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == tag
+    assert response.content == b""
+    assert "data_versions" in reads
+    assert not set(reads) & {"habits", "habit_logs", "mood_logs", "daily_rollups", "settings"}
+
+    stale = api.get(path, headers={**headers, "If-None-Match": 'W/"999-2000-01-01"'})
+    assert stale.status_code == 200
+
+
+def test_every_mutating_route_bumps_the_version(api):
+    headers = register(api)
+    mutations = []
+
+    def changed(name, send):
+        before = etag(api, headers)
+        response = send()
+        assert response.status_code == 200, (name, response.text)
+        mutations.append((name, etag(api, headers) != before))
+        return response
+
+    habit = changed("create habit", lambda: api.post(
+        "/api/habits", json={"name": "Read", "color": "#fff"}, headers=headers)).json()
+    changed("update habit", lambda: api.put(
+        f"/api/habits/{habit['id']}", json={"name": "Write", "color": "#fff"}, headers=headers))
+    log = {"habit_id": habit["id"], "date": "2024-01-01", "completed": True}
+    changed("create habit log", lambda: api.post("/api/habit-logs", json=log, headers=headers))
+    changed("habit log batch", lambda: api.post(
+        "/api/habit-logs/batch", json={"logs": [{**log, "completed": False}]}, headers=headers))
+    changed("habit log import", lambda: api.post(
+        "/api/habit-logs/import", content=f'{{"habit_id": "{habit["id"]}", "date": "2024-01-02", "completed": true}}\n',
+        headers=headers))
+    mood = {"date": "2024-01-01", "mood_level": 3, "emoji": ":)"}
+    changed("create mood log", lambda: api.post("/api/mood-logs", json=mood, headers=headers))
+    changed("mood log batch", lambda: api.post(
+        "/api/mood-logs/batch", json={"logs": [{**mood, "mood_level": 4}]}, headers=headers))
+    changed("mood log import", lambda: api.post(
+        "/api/mood-logs/import", content='{"date": "2024-01-02", "mood_level": 2, "emoji": ":("}\n', headers=headers))
+    changed("delete mood log", lambda: api.delete("/api/mood-logs/2024-01-01", headers=headers))
+    changed("update settings", lambda: api.put("/api/settings", json={"theme": "dark"}, headers=headers))
+    changed("delete habit", lambda: api.delete(f"/api/habits/{habit['id']}", headers=headers))
+
+    assert [name for name, bumped in mutations if not bumped] == []
@@ -0,0 +1,109 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from dates import MIGRATION_ID, DateStorage, migrate_dates, normalize_day, to_db_day
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_to_db_day_accepts_only_calendar_days():
+    assert to_db_day("2024-01-02") == datetime(2024, 1, 2)
+    assert normalize_day("2024-1-2") == "2024-01-02"
+    for value in ("2024-01-01T18:30:00", "20240102", "2024-W01-3", "2024-02-30", ""):
+        with pytest.raises(ValueError):
+            to_db_day(value)
+
+
+def test_compat_stream_merges_legacy_and_native_days_in_order():
+    async def scenario():
+        db = AsyncMongoMockClient()["test"]
+        await db.habit_logs.insert_many([
+            {"user_id": "u1", "id": "a", "date": "2024-01-01"},
+            {"user_id": "u1", "id": "b", "date": datetime(2024, 1, 2)},
+            {"user_id": "u1", "id": "c", "date": "2024-01-03"},
+            {"user_id": "u1", "id": "d", "date": datetime(2024, 1, 3)},
+            {"user_id": "u1", "id": "e", "date": datetime(2024, 1, 5)},
+            {"user_id": "u2", "id": "f", "date": "2024-01-04"}
+        ])
+        storage = DateStorage()
+
+        def build(day):
+            return {"user_id": "u1", "date": {"$gte": day("2024-01-02")}}
+
+        descending = await storage.find(db.habit_logs, build, {"_id": 0}, [("date", -1), ("id", -1)])
+        limited = await storage.find(db.habit_logs, build, {"_id": 0}, [("date", 1), ("id", 1)], limit=2)
+        return descending, limited
+
+    descending, limited = run(scenario())
+    assert [(doc["date"], doc["id"]) for doc in descending] == [
+        ("2024-01-05", "e"), ("2024-01-03", "d"), ("2024-01-03", "c"), ("2024-01-02", "b")
+    ]
+    assert [doc["id"] for doc in limited] == ["b", "c"]
+
+
+def test_migration_resumes_from_its_checkpoint():
+    class Interrupted(Exception):
+        pass
+
+    async def scenario():
+        db = AsyncMongoMockClient()["test"]
+        await db.mood_logs.insert_many([
+            {"_id": i, "user_id": "u1", "id": str(i), "date": f"2024-01-{i:02d}", "created_at": "2024-02-01T00:00:00+00:00"}
+            for i in range(1, 6)
+        ])
+        scanned = []
+
+        def interrupt(name, progress):
+            scanned.append((name, progress["scanned"]))
+            raise Interrupted()
+
+        with pytest.raises(Interrupted):
+            await migrate_dates(db, batch_size=2, report=interrupt)
+        state = await db.migrations.find_one({"_id": MIGRATION_ID})
+        # Written by an old API instance behind the checkpoint
+        await db.mood_logs.insert_one({"_id": 0, "user_id": "u2", "id": "0", "date": "2024-01-09", "created_at": "2024-02-01T00:00:00+00:00"})
+
+        scanned.clear()
+        result = await migrate_dates(db, batch_size=2, report=lambda name, progress: scanned.append((name, progress["scanned"])))
+        docs = await db.mood_logs.find({}, {"_id": 0, "date": 1, "created_at": 1}).to_list(None)
+        return state, scanned, result, docs
+
+    state, scanned, result, docs = run(scenario())
+    assert state["checkpoints"]["mood_logs"] == 2
+    assert "completed_at" not in state
+    # The resumed pass continues after the checkpoint; the next pass picks
+    # up the document written behind it
+    assert [count for name, count in scanned if name == "mood_logs"] == [2, 3, 1]
+    assert result["completed"] and result["invalid"] == 0
+    assert all(isinstance(doc["date"], datetime) and isinstance(doc["created_at"], datetime) for doc in docs)
+
+
+def test_migration_keeps_the_native_copy_of_a_duplicated_key():
+    async def scenario():
+        db = AsyncMongoMockClient()["test"]
+        await db.habit_logs.create_index([("user_id", 1), ("habit_id", 1), ("date", 1)], unique=True)
+        await db.habit_logs.insert_many([
+            {"user_id": "u1", "habit_id": "h1", "id": "legacy", "date": "2024-01-01", "completed": False},
+            {"user_id": "u1", "habit_id": "h1", "id": "native", "date": datetime(2024, 1, 1), "completed": True},
+            {"user_id": "u1", "habit_id": "h1", "id": "other", "date": "2024-01-02", "completed": True},
+            {"user_id": "u1", "habit_id": "h1", "id": "invalid", "date": "2024-01-02T10:00:00", "completed": True}
+        ])
+        result = await migrate_dates(db)
+        docs = await db.habit_logs.find({}, {"_id": 0, "id": 1, "date": 1}).sort("id", 1).to_list(None)
+        storage = DateStorage()
+        await storage.load(db)
+        return result, docs, storage.native
+
+    result, docs, native = run(scenario())
+    assert result["duplicates"] == 1 and result["invalid"] == 1
+    assert docs == [
+        {"id": "invalid", "date": "2024-01-02T10:00:00"},
+        {"id": "native", "date": datetime(2024, 1, 1)},
+        {"id": "other", "date": datetime(2024, 1, 2)}
+    ]
+    assert native
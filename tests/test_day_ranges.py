@@ -0,0 +1,22 @@
+import pytest
+
+from tests.conftest import register
+
+
+@pytest.mark.parametrize("path", ["/api/habits/heatmaps", "/api/analytics/correlations"])
+@pytest.mark.parametrize("params", [
+    {"from": "20240101"},
+    {"to": "2024-01-01T10:00"},
+    {"from": "2024-W01-1"},
+    {"from": "2024-01-10", "to": "2024-01-01"}
+])
+def test_day_ranges_accept_only_calendar_days(api, path, params):
+    headers = register(api)
+    assert api.get(path, params=params, headers=headers).status_code == 400
+
+
+@pytest.mark.parametrize("path", ["/api/habits/heatmaps", "/api/analytics/correlations"])
+def test_day_ranges_accept_a_valid_range(api, path):
+    headers = register(api)
+    params = {"from": "2024-01-01", "to": "2024-01-31"}
+    assert api.get(path, params=params, headers=headers).status_code == 200
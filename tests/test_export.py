@@ -0,0 +1,20 @@
+import json
+from datetime import date, timedelta
+
+from tests.conftest import register
+
+
+def test_export_reports_the_effective_current_streak(api):
+    headers = register(api)
+    habit = api.post("/api/habits", json={"name": "Read", "color": "#fff"}, headers=headers).json()
+    # A run that ended three days ago is stored but no longer current
+    api.post("/api/habit-logs", json={
+        "habit_id": habit["id"], "date": (date.today() - timedelta(days=3)).isoformat(), "completed": True
+    }, headers=headers)
+    assert api.get("/api/habits", headers=headers).json()[0]["current_streak"] == 0
+
+    response = api.get("/api/export", params={"format": "ndjson"}, headers={**headers, "Accept-Encoding": "identity"})
+    records = [json.loads(line) for line in response.text.splitlines() if line]
+    [exported] = [record for record in records if record["type"] == "habit"]
+    assert exported["current_streak"] == 0
+    assert exported["longest_streak"] == 1
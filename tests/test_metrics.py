@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+from prometheus_client import CollectorRegistry, Counter, Histogram
+
+from metrics import observe
+
+
+def metrics():
+    registry = CollectorRegistry()
+    latency = Histogram("test_latency_seconds", "Latency", ["operation"], registry=registry)
+    errors = Counter("test_errors_total", "Errors", ["operation"], registry=registry)
+    return registry, latency, errors
+
+
+def test_observe_counts_errors_and_times_every_call():
+    registry, latency, errors = metrics()
+    with observe(latency, errors, operation="complete"):
+        pass
+    with pytest.raises(RuntimeError):
+        with observe(latency, errors, operation="complete"):
+            raise RuntimeError("upstream failed")
+    assert registry.get_sample_value("test_errors_total", {"operation": "complete"}) == 1
+    assert registry.get_sample_value("test_latency_seconds_count", {"operation": "complete"}) == 2
+
+
+def test_observe_counts_calls_cut_off_by_a_timeout():
+    registry, latency, errors = metrics()
+
+    async def call():
+        with observe(latency, errors, operation="complete"):
+            await asyncio.sleep(1)
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(call(), 0.01)
+
+    asyncio.run(scenario())
+    assert registry.get_sample_value("test_errors_total", {"operation": "complete"}) == 1
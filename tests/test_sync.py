@@ -0,0 +1,95 @@
+from datetime import date, datetime, timedelta, timezone
+
+from tests.conftest import register
+
+
+def sync_all(api, headers, since=None, limit=2):
+    # Follows continuation tokens; returns every page of one sync
+    pages = []
+    while True:
+        params = {"limit": limit, **({"since": since} if since else {})}
+        response = api.get("/api/sync", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        pages.append(response.json())
+        since = pages[-1]["token"]
+        if not pages[-1]["more"]:
+            return pages
+
+
+def ids(pages, collection):
+    return [doc["id"] for page in pages for doc in page[collection]]
+
+
+def add_logs(api, headers, habit_id, days):
+    today = date.today()
+    return [
+        api.post("/api/habit-logs", json={
+            "habit_id": habit_id, "date": (today - timedelta(days=i)).isoformat(), "completed": True
+        }, headers=headers).json()["id"]
+        for i in range(days)
+    ]
+
+
+def test_full_snapshot_is_paged(api, server):
+    headers = register(api)
+    habit = api.post("/api/habits", json={"name": "Read", "color": "#fff"}, headers=headers).json()
+    log_ids = add_logs(api, headers, habit["id"], 5)
+
+    # A log written before updated_at existed sorts first
+    async def legacy():
+        await server.db.habit_logs.update_one({"id": log_ids[0]}, {"$unset": {"updated_at": ""}})
+    api.portal.call(legacy)
+
+    pages = sync_all(api, headers)
+    assert len(pages) == 3
+    assert all(page["full"] for page in pages)
+    assert all(len(page["habit_logs"]) <= 2 for page in pages)
+    assert sorted(ids(pages, "habit_logs")) == sorted(log_ids)
+    assert ids(pages, "habits") == [habit["id"]]
+    assert "p" not in server.decode_sync_token(pages[-1]["token"])
+
+
+def test_delta_returns_changes_and_tombstones_since_the_token(api):
+    headers = register(api)
+    habit = api.post("/api/habits", json={"name": "Read", "color": "#fff"}, headers=headers).json()
+    api.post("/api/mood-logs", json={"date": "2024-01-01", "mood_level": 3, "emoji": ":)"}, headers=headers)
+    token = sync_all(api, headers)[-1]["token"]
+
+    api.put(f"/api/habits/{habit['id']}", json={"name": "Write", "color": "#fff"}, headers=headers)
+    api.delete("/api/mood-logs/2024-01-01", headers=headers)
+    [page] = sync_all(api, headers, token, limit=10)
+    assert not page["full"]
+    assert [doc["name"] for doc in page["habits"]] == ["Write"]
+    assert len(page["deleted"]["mood_logs"]) == 1
+
+
+def test_delta_window_overlaps_the_previous_sync(api, server):
+    headers = register(api)
+    habit = api.post("/api/habits", json={"name": "Read", "color": "#fff"}, headers=headers).json()
+    token = sync_all(api, headers)[-1]["token"]
+    since = server.decode_sync_token(token)["t"]
+
+    # Committed out of order: stamped just before the previous sync started
+    async def late_write():
+        stamped = datetime.fromisoformat(since) - timedelta(seconds=server.SYNC_OVERLAP_SECONDS - 1)
+        await server.db.habits.update_one({"id": habit["id"]}, {"$set": {
+            "name": "Late", "updated_at": stamped.isoformat(timespec="microseconds")
+        }})
+    api.portal.call(late_write)
+
+    [page] = sync_all(api, headers, token)
+    assert [doc["name"] for doc in page["habits"]] == ["Late"]
+
+
+def test_tokens_older_than_retention_get_a_full_snapshot(api, server):
+    headers = register(api)
+    api.post("/api/habits", json={"name": "Read", "color": "#fff"}, headers=headers)
+    expired = datetime.now(timezone.utc) - timedelta(days=server.SYNC_TOMBSTONE_RETENTION_DAYS + 1)
+    pages = sync_all(api, headers, server.encode_sync_token(expired.isoformat()))
+    assert pages[0]["full"]
+    assert len(ids(pages, "habits")) == 1
+
+
+def test_invalid_tokens_are_rejected(api):
+    headers = register(api)
+    assert api.get("/api/sync", params={"since": "not-a-token"}, headers=headers).status_code == 400
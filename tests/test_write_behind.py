@@ -0,0 +1,35 @@
+import asyncio
+import threading
+from datetime import date
+
+from tests.conftest import register
+
+
+def test_toggle_during_an_in_flight_flush_updates_streaks(api, server, monkeypatch):
+    monkeypatch.setattr(server, "HABIT_LOG_WRITE_BEHIND", True)
+    monkeypatch.setattr(server.habit_log_writes, "interval_seconds", 60)
+    headers = register(api)
+    habit = api.post("/api/habits", json={"name": "Read", "color": "#fff"}, headers=headers).json()
+    log = {"habit_id": habit["id"], "date": date.today().isoformat()}
+
+    # Hold the flush inside its write until the second toggle is buffered
+    writing, release = threading.Event(), threading.Event()
+    write = server.habit_log_writes._write
+
+    async def held_write(values):
+        writing.set()
+        while not release.is_set():
+            await asyncio.sleep(0.01)
+        await write(values)
+
+    monkeypatch.setattr(server.habit_log_writes, "_write", held_write)
+    api.post("/api/habit-logs", json={**log, "completed": True}, headers=headers)
+    flush = api.portal.start_task_soon(server.habit_log_writes.flush)
+    assert writing.wait(5)
+    api.post("/api/habit-logs", json={**log, "completed": False}, headers=headers)
+    release.set()
+    flush.result(5)
+
+    [stored] = api.get("/api/habits", headers=headers).json()
+    assert (stored["current_streak"], stored["longest_streak"], stored["last_completed"]) == (0, 0, None)
+    assert api.portal.call(server.verify_streaks) == []
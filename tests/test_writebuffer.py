@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+from writebuffer import WriteBehindBuffer
+
+
+class Recorder:
+    def __init__(self, fail: int = 0):
+        self.batches = []
+        self.fail = fail
+
+    async def __call__(self, values):
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError("write failed")
+        self.batches.append(values)
+
+
+def test_coalesces_puts_per_key():
+    async def scenario():
+        write = Recorder()
+        buffer = WriteBehindBuffer(write, interval_seconds=60)
+        await buffer.put(("u1", "a"), 1)
+        await buffer.put(("u1", "a"), 2)
+        await buffer.put(("u1", "b"), 3)
+        assert buffer.get(("u1", "a")) == 2
+        await buffer.flush()
+        await buffer.stop()
+        return write, buffer
+
+    write, buffer = asyncio.run(scenario())
+    assert write.batches == [[2, 3]]
+    assert (buffer.puts, buffer.writes) == (3, 2)
+
+
+def test_flushes_at_max_entries_and_after_interval():
+    async def scenario():
+        write = Recorder()
+        buffer = WriteBehindBuffer(write, max_entries=2, interval_seconds=0.01)
+        await buffer.put(("u1", "a"), 1)
+        await buffer.put(("u1", "b"), 2)
+        full = list(write.batches)
+        await buffer.put(("u1", "c"), 3)
+        await asyncio.sleep(0.05)
+        return full, write.batches, buffer.has_pending()
+
+    full, batches, pending = asyncio.run(scenario())
+    assert full == [[1, 2]]
+    assert batches == [[1, 2], [3]]
+    assert not pending
+
+
+def test_flush_for_one_user_leaves_others_pending():
+    async def scenario():
+        write = Recorder()
+        buffer = WriteBehindBuffer(write, interval_seconds=60)
+        await buffer.put(("u1", "a"), 1)
+        await buffer.put(("u2", "a"), 2)
+        await buffer.flush("u1")
+        state = (list(write.batches), buffer.has_pending("u1"), buffer.has_pending("u2"))
+        await buffer.stop()
+        return state
+
+    batches, u1_pending, u2_pending = asyncio.run(scenario())
+    assert batches == [[1]]
+    assert not u1_pending and u2_pending
+
+
+def test_failed_write_is_requeued_without_overwriting_newer_values():
+    async def scenario():
+        write = Recorder(fail=1)
+        buffer = WriteBehindBuffer(write, interval_seconds=60)
+        await buffer.put(("u1", "a"), 1)
+        await buffer.put(("u1", "b"), 2)
+        with pytest.raises(RuntimeError):
+            await buffer.flush()
+        assert buffer.has_pending("u1")
+        await buffer.put(("u1", "a"), 3)
+        await buffer.flush()
+        await buffer.stop()
+        return write, buffer
+
+    write, buffer = asyncio.run(scenario())
+    assert write.batches == [[3, 2]]
+    assert buffer.writes == 2
+
+
+def test_flush_waits_for_the_users_write_in_flight_only():
+    async def scenario():
+        release = asyncio.Event()
+        order = []
+
+        async def write(values):
+            if values == ["slow"]:
+                await release.wait()
+            order.append(values)
+
+        buffer = WriteBehindBuffer(write, interval_seconds=60)
+        await buffer.put(("u1", "a"), "slow")
+        slow = asyncio.create_task(buffer.flush())
+        await asyncio.sleep(0)
+        # While u1's write is in flight, its value is still visible
+        assert buffer.lookup(("u1", "a")) == ("slow", True)
+        await buffer.put(("u2", "a"), "other")
+        await asyncio.wait_for(buffer.flush("u2"), 1)
+        await buffer.put(("u1", "a"), "newer")
+        assert buffer.lookup(("u1", "a")) == ("newer", False)
+        waiting = asyncio.create_task(buffer.flush("u1"))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        release.set()
+        await asyncio.gather(slow, waiting)
+        return order
+
+    assert asyncio.run(scenario()) == [["other"], ["slow"], ["newer"]]
+
+
+def test_stop_writes_pending_values_and_cancels_the_timer():
+    async def scenario():
+        write = Recorder()
+        buffer = WriteBehindBuffer(write, interval_seconds=60)
+        await buffer.put(("u1", "a"), 1)
+        await buffer.put(("u2", "a"), 2)
+        await buffer.stop()
+        return write, buffer
+
+    write, buffer = asyncio.run(scenario())
+    assert write.batches == [[1, 2]]
+    assert not buffer.has_pending()
+    assert buffer._timer is None